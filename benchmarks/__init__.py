@@ -0,0 +1,10 @@
+"""
+Benchmarks of the hot paths of Teal: dumping and loading schemas,
+loading queries, parsing arguments, finding resources through the
+app and creating the app. Run them from the root of the repository::
+
+    python -m benchmarks --save-baseline  # Before optimizing
+    python -m benchmarks  # After, comparing with the baseline
+
+See ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,280 @@
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Dict, Iterable, List, Tuple
+
+import click
+from flask import request
+from flask.testing import FlaskClient
+from marshmallow import Schema as MarshmallowSchema
+from marshmallow.fields import Integer, Nested
+from sqlalchemy.orm import joinedload
+
+from teal.config import Config
+from teal.db import Model, SQLAlchemy
+from teal.query import Equal, ILike, Or, Query, Sort, SortField, find_clauses
+from teal.resource import View
+from teal.teal import Teal
+from tests.conftest import f_config
+
+Benchmark = Callable[['Bench'], ContextManager[Callable[[], object]]]
+
+BENCHMARKS = OrderedDict()  # type: Dict[str, Benchmark]
+"""The benchmarks, by name, in execution order."""
+
+
+def benchmark(f):
+    """
+    Registers a benchmark: a generator setting up what
+    to measure and yielding a function that executes it once.
+    """
+    BENCHMARKS[f.__name__] = contextmanager(f)
+    return f
+
+
+class Bench:
+    """
+    The app the benchmarks run on: the Device, Computer and Component
+    resources of the tests (see :func:`tests.conftest.f_config`)
+    with ``computers`` computers of ``components`` components each.
+
+    Collections of devices can be filtered with
+    ``?filter={"model": "pc", "id": [1, 2]}`` and sorted with
+    ``?sort={"id": true}``, and are returned with one nested level.
+    """
+
+    def __init__(self, computers=100, components=10, seed=0) -> None:
+        self.computers = computers
+        self.components = components
+        self.seed = seed
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+            SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+        self.db = SQLAlchemy(model_class=Model)
+        self.config = f_config(BenchConfig(), self.db)
+        DeviceDef, ComponentDef, ComputerDef = self.config.RESOURCE_DEFINITIONS
+        self.Device = Device = DeviceDef.MODEL
+        self.Component = ComponentDef.MODEL
+        self.Computer = ComputerDef.MODEL
+
+        class DeviceQuery(Query):
+            model = ILike(Device.model)
+            id = Or(Equal(Device.id, Integer()))
+
+        class DeviceSort(Sort):
+            id = SortField(Device.id)
+
+        class FindArgs(MarshmallowSchema):
+            filter = Nested(DeviceQuery, missing=[])
+            sort = Nested(DeviceSort, missing=[])
+
+        def find(view: View, args: dict):
+            filters, order = find_clauses(view.find_args, args)
+            q = view.resource_def.MODEL.query.filter(*filters).order_by(*order)
+            return view.schema.jsonify(q.all(), many=True, nested=1)
+
+        self.DeviceQuery, self.DeviceSort = DeviceQuery, DeviceSort
+        DeviceDef.VIEW.FindArgs = FindArgs
+        DeviceDef.VIEW.find = find
+        self.app = Teal(config=self.config, db=self.db)
+        with self.app.app_context():
+            self.db.create_all()
+            self.db.session.add_all(self.generate())
+            self.db.session.commit()
+
+    def generate(self) -> List[Model]:
+        """Synthetic computers with their components, always
+        the same for the same ``seed``."""
+        rnd = random.Random(self.seed)
+        ids = iter(range(1, sys.maxsize))
+        return [self.Computer(id=next(ids),
+                              model='pc-{}'.format(rnd.randrange(1000)),
+                              components=[self.Component(id=next(ids),
+                                                         model='c-{}'.format(rnd.randrange(1000)))
+                                          for _ in range(self.components)])
+                for _ in range(self.computers)]
+
+    def computer_dicts(self) -> List[dict]:
+        """The synthetic computers as clients POST them."""
+        return [{'id': c.id,
+                 'type': 'Computer',
+                 'model': c.model,
+                 'components': [{'id': cc.id, 'type': 'Component', 'model': cc.model}
+                                for cc in c.components]}
+                for c in self.generate()]
+
+
+@benchmark
+def startup(bench: Bench):
+    """Creating the app."""
+    yield lambda: Teal(config=bench.config, db=bench.db)
+
+
+def _dump(bench: Bench, nested: int):
+    with bench.app.app_context():
+        computers = bench.Computer.query.options(joinedload(bench.Computer.components)).all()
+        schema = bench.app.resources['Computer'].schema
+        yield lambda: schema.dump(computers, many=True, nested=nested)
+
+
+@benchmark
+def dump(bench: Bench):
+    """Schema.dump of the computers, without their components."""
+    yield from _dump(bench, 0)
+
+
+@benchmark
+def dump_nested(bench: Bench):
+    """Schema.dump of the computers with their components."""
+    yield from _dump(bench, 1)
+
+
+@benchmark
+def load_nested(bench: Bench):
+    """Schema.load of computers, loading their components through NestedOn."""
+    computers = bench.computer_dicts()
+    with bench.app.app_context():
+        schema = bench.app.resources['Computer'].schema
+        yield lambda: schema.load(computers, many=True)
+
+
+@benchmark
+def query_load(bench: Bench):
+    """Loading the SQL clauses of a Query and a Sort."""
+    query, sort = bench.DeviceQuery(), bench.DeviceSort()
+    with bench.app.app_context():
+        yield lambda: (query.load({'model': 'pc', 'id': list(range(20))}),
+                       sort.load({'id': True}))
+
+
+@benchmark
+def parse_args(bench: Bench):
+    """NestedQueryFlaskParser parsing the JSON arguments of a find."""
+    view = bench.app.view_functions['Device.main'].view_class
+    find_args = view.FindArgs()
+    url = '/devices/?filter={"model": "pc", "id": [1, 2, 3]}&sort={"id": true}'
+    with bench.app.test_request_context(url):
+        yield lambda: view.QUERY_PARSER.parse(find_args, request, locations=('querystring',))
+
+
+@benchmark
+def find(bench: Bench):
+    """A GET of the computers, with their components, through the app."""
+    client = FlaskClient(bench.app, bench.app.response_class)
+    url = '/computers/?filter={"model": "pc"}&sort={"id": true}'
+
+    def get():
+        response = client.get(url)
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    yield get
+
+
+def run(names: Iterable[str], bench: Bench, repeat=5) -> Dict[str, dict]:
+    """
+    Runs the benchmarks, each at least 0.2 seconds ``repeat``
+    times, returning the seconds one execution takes.
+    """
+    results = OrderedDict()
+    for name in names:
+        with BENCHMARKS[name](bench) as f:
+            timer = timeit.Timer(f)
+            number, _ = timer.autorange()
+            times = [t / number for t in timer.repeat(repeat, number)]
+        results[name] = {'number': number, 'min': min(times), 'median': statistics.median(times)}
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) \
+        -> List[Tuple[str, float, float, str]]:
+    """
+    Compares the median of the results with the baseline.
+
+    :return: A list of (name, baseline median, median, verdict),
+             where verdict is ``slower`` or ``faster`` if the ratio
+             of the medians is beyond the ``tolerance``, ``same``
+             otherwise, or ``new``.
+    """
+    comparison = []
+    for name, result in results.items():
+        if name not in baseline:
+            comparison.append((name, None, result['median'], 'new'))
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        verdict = 'slower' if ratio > 1 + tolerance else 'faster' if ratio < 1 - tolerance else 'same'
+        comparison.append((name, baseline[name]['median'], result['median'], verdict))
+    return comparison
+
+
+def metadata(bench: Bench) -> dict:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'computers': bench.computers,
+        'components': bench.components,
+        'seed': bench.seed
+    }
+
+
+def _ms(seconds: float) -> str:
+    return '{:.3f}'.format(seconds * 1000) if seconds is not None else '-'
+
+
+@click.command()
+@click.option('--benchmark', '-k', 'names', multiple=True, type=click.Choice(BENCHMARKS),
+              help='Run only this benchmark. Repeat it to run several.')
+@click.option('--output', '-o', type=click.File('w'), help='Write the results to this JSON file.')
+@click.option('--baseline', '-b', type=click.Path(dir_okay=False),
+              default='benchmarks/baseline.json', show_default=True,
+              help='Compare the results with this JSON file of results.')
+@click.option('--save-baseline', is_flag=True,
+              help='Write the results to the baseline instead of comparing them.')
+@click.option('--tolerance', '-t', default=0.2, show_default=True,
+              help='Fail if a benchmark is slower than the baseline by this fraction.')
+@click.option('--repeat', '-r', default=5, show_default=True,
+              help='Times to measure each benchmark; the median is compared.')
+@click.option('--computers', default=100, show_default=True, help='Synthetic computers.')
+@click.option('--components', default=10, show_default=True, help='Components per computer.')
+def main(names, output, baseline, save_baseline, tolerance, repeat, computers, components):
+    """
+    Benchmarks the serialization, validation and query hot paths of
+    Teal, comparing the results with a baseline from the same machine.
+    Times are milliseconds.
+    """
+    bench = Bench(computers, components)
+    results = run(names or BENCHMARKS, bench, repeat)
+    document = {'metadata': metadata(bench), 'results': results}
+    if output:
+        json.dump(document, output, indent=2)
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+        for name, result in results.items():
+            click.echo('{:<14} {:>12}'.format(name, _ms(result['median'])))
+        return
+    try:
+        with open(baseline) as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        stored = {'metadata': {}, 'results': {}}
+    if stored['metadata'] and stored['metadata'] != document['metadata']:
+        click.secho('The baseline was measured in another setup: {}'.format(stored['metadata']),
+                    fg='yellow')
+    comparison = compare(results, stored['results'], tolerance)
+    click.echo('{:<14} {:>12} {:>12}'.format('benchmark', 'baseline', 'median'))
+    for name, before, now, verdict in comparison:
+        colors = {'slower': 'red', 'faster': 'green'}
+        click.echo('{:<14} {:>12} {:>12} '.format(name, _ms(before), _ms(now)), nl=False)
+        click.secho(verdict, fg=colors.get(verdict))
+    if any(verdict == 'slower' for *_, verdict in comparison):
+        sys.exit(1)
@@ -6,7 +6,7 @@ with open('README.md') as f:
 setup(
     name='teal',
     version='0.2.0a40',
-    packages=find_packages(),
+    packages=find_packages(exclude=('benchmarks',)),
     url='https://github.com/ereuse/teal',
     license='BSD',
     author='Xavier Bustamante Talavera',
@@ -20,7 +20,7 @@ setup(
         'apispec-webframeworks',
         'boltons',
         'ereuse-utils[naming, test, session, cli]>=0.4.0b21',
-        'flask>=1.0',
+        'flask>=2.0',
         'flask-sqlalchemy>=2.5.1',
         'sqlalchemy-utils[password, color, phone]',
         'marshmallow>=3.0.0',
@@ -28,8 +28,15 @@ setup(
         'webargs',
         'flask-cors',
         'click-spinner',
+        'importlib-metadata; python_version < "3.8"',
         'Werkzeug==2.0.3',  # https://stackoverflow.com/a/73476925/1538221
     ],
+    extras_require={
+        'async': ['flask[async]'],
+        'zstd': ['zstandard'],
+        'msgpack': ['msgpack'],
+        'cbor': ['cbor2']
+    },
     tests_requires=[
         'pytest',
         'pytest-datadir'
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import List, Tuple
+
+from flask import Flask
+
+
+class ASGIApp:
+    """
+    Serves a Teal app through ASGI servers, like Uvicorn or Hypercorn::
+
+        app = Teal(config=MyConfig(), db=db)
+        asgi = ASGIApp(app)
+        # uvicorn myproject:asgi
+
+    The app does not change: resources, views (sync and async, see
+    :meth:`teal.db.SQLAlchemy.run_sync`) and schemas work as in WSGI.
+
+    What changes is that connections only take a thread from a pool of
+    ``ASGI_WORKERS`` while the app computes the response. The event
+    loop receives the bodies of the requests, spooling the big ones
+    to disk, and sends the responses, so slow clients and idle
+    connections do not hold threads. Streamed responses hold their
+    thread until they are generated, buffering up to
+    :attr:`.BUFFERED_CHUNKS` chunks ahead of the client. Clients
+    that disconnect stop the generation of their response.
+    """
+    SPOOL_SIZE = 64 * 1024
+    """Request bodies bigger than these bytes are spooled to disk."""
+    BUFFERED_CHUNKS = 16
+    """Chunks of a streamed response generated ahead of the client."""
+
+    def __init__(self, app: Flask) -> None:
+        self.app = app
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_WORKERS', 32),
+                                           thread_name_prefix='teal-asgi')
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            with SpooledTemporaryFile(max_size=self.SPOOL_SIZE) as body:
+                while True:
+                    message = await receive()
+                    if message['type'] == 'http.disconnect':
+                        return
+                    body.write(message.get('body', b''))
+                    if not message.get('more_body'):
+                        break
+                body.seek(0)
+                await self.respond(scope, body, receive, send)
+        else:
+            raise ValueError('Teal does not handle {} connections.'.format(scope['type']))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, scope: dict, body, receive, send):
+        loop = asyncio.get_event_loop()
+        response = _Response(loop, self.BUFFERED_CHUNKS)
+        wsgi = loop.run_in_executor(self.executor, response.run, self.app, environ(scope, body))
+        disconnect = loop.create_task(self.disconnect(receive))
+        try:
+            started = False
+            while True:
+                get = loop.create_task(response.chunks.get())
+                await asyncio.wait((get, disconnect), return_when=asyncio.FIRST_COMPLETED)
+                if disconnect.done():  # The client is gone
+                    get.cancel()
+                    return
+                chunk = get.result()
+                if chunk is None:
+                    break
+                if not started:
+                    await send({'type': 'http.response.start',
+                                'status': response.status,
+                                'headers': response.headers})
+                    started = True
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await wsgi  # Raise the errors of the app
+            if not started:
+                await send({'type': 'http.response.start',
+                            'status': response.status,
+                            'headers': response.headers})
+            await send({'type': 'http.response.body'})
+        finally:
+            disconnect.cancel()
+            if not wsgi.done():  # The client is gone: stop generating
+                response.aborted.set()
+                while not response.chunks.empty():
+                    response.chunks.get_nowait()
+
+    @staticmethod
+    async def disconnect(receive):
+        """Waits until the client disconnects."""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+
+class _Response:
+    """The response of the app, passed from its thread
+    to the event loop through :attr:`.chunks`."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffered_chunks: int) -> None:
+        self.loop = loop
+        self.chunks = asyncio.Queue(buffered_chunks)
+        self.aborted = threading.Event()
+        self.status = None  # type: int
+        self.headers = []  # type: List[Tuple[bytes, bytes]]
+
+    def start_response(self, status: str, headers: list, exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in headers]
+
+    def run(self, app: Flask, environ: dict):
+        try:
+            iterable = app(environ, self.start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        self.put(chunk)
+                    if self.aborted.is_set():
+                        break
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            self.put(None)  # The end of the response
+
+    def put(self, chunk):
+        if self.aborted.is_set():
+            return
+        put = self.chunks.put(chunk)
+        try:
+            future = asyncio.run_coroutine_threadsafe(put, self.loop)
+        except RuntimeError:  # The loop is closed
+            put.close()
+            return
+        while not self.aborted.is_set():
+            try:
+                return future.result(timeout=1)
+            except FutureTimeoutError:
+                pass
+        future.cancel()
+
+
+def environ(scope: dict, body) -> dict:
+    """The WSGI environ of an ASGI HTTP scope."""
+    server = scope.get('server') or ('localhost', 80)
+    env = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope['http_version']),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,  # We have all the body, with or without Content-Length
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        env['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in {'CONTENT_LENGTH', 'CONTENT_TYPE'}:
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        env[name] = env[name] + ',' + value if name in env else value
+    return env
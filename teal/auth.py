@@ -51,8 +51,10 @@ class Auth:
 
         An exception (expected Unauthorized) is raised if
         authentication failed.
+
+        ``authenticate`` can be a coroutine.
         """
-        g.user = self.authenticate(auth.username, auth.password)
+        g.user = current_app.ensure_sync(self.authenticate)(auth.username, auth.password)
 
     def authenticate(self, username: str, password: str) -> object:
         """
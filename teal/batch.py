@@ -0,0 +1,112 @@
+import sys
+from contextlib import ExitStack
+
+from flask import Response, current_app as app, jsonify, request
+from marshmallow import Schema as MarshmallowSchema
+from marshmallow.fields import Dict, Raw, Str
+from marshmallow.validate import OneOf
+from werkzeug.exceptions import BadRequest, InternalServerError, UnprocessableEntity
+from werkzeug.test import EnvironBuilder
+
+
+class SubRequest(MarshmallowSchema):
+    """A request in a batch."""
+    method = Str(missing='GET', validate=OneOf({'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}))
+    path = Str(required=True)
+    query = Raw(missing=None, description='A dictionary or a query string.')
+    body = Raw(missing=None, description='The JSON body.')
+    headers = Dict(missing=dict)
+
+
+class Batch:
+    """
+    An endpoint executing many requests in one round trip.
+
+    Clients ``POST`` a list of requests::
+
+        [
+            {"method": "GET", "path": "/devices/", "query": {"page": 2}},
+            {"method": "POST", "path": "/devices/", "body": {"type": "Computer"}}
+        ]
+
+    And receive the list of responses, in the same order::
+
+        [
+            {"status": 200, "headers": {...}, "body": [...]},
+            {"status": 201, "headers": {...}, "body": {...}}
+        ]
+
+    The requests are executed one after the other in the app context
+    of the batch, with the credentials, cookies and language of the
+    batch request. Each request commits as usual, unless the client
+    passes ``?transaction=true``: then all requests are executed
+    in one database transaction and the batch stops at the first
+    request that fails, rolling back everything.
+
+    A request raising an unexpected error gets a ``500`` response,
+    as any other failing request. Batches cannot be nested: a
+    request for a batch inside a batch gets a ``400`` response.
+
+    :class:`teal.teal.Teal` sets this endpoint when there
+    is a ``BATCH_MAX_REQUESTS``.
+    """
+    FORWARDED_HEADERS = 'Authorization', 'Cookie', 'Accept-Language'
+    """The headers of the batch request the requests inherit."""
+    TRUE = {'1', 'true'}
+    ENVIRON_KEY = 'teal.batch'
+    """Marks the environ of the requests of a batch."""
+
+    def __call__(self) -> Response:
+        """Execute requests in one round trip."""
+        if request.environ.get(self.ENVIRON_KEY):
+            raise BadRequest('Batches cannot be nested.')
+        sub_requests = SubRequest(many=True).load(request.get_json(validate=False))
+        if len(sub_requests) > app.config['BATCH_MAX_REQUESTS']:
+            raise UnprocessableEntity('Too many requests in the batch.')
+        transaction = request.args.get('transaction', '').lower() in self.TRUE
+        session = app.db.session
+        responses = []
+        with ExitStack() as stack:
+            if transaction:
+                stack.enter_context(session().atomic())
+            for sub_request in sub_requests:
+                response = self.dispatch(sub_request)
+                responses.append(self.dump(response))
+                if transaction:
+                    if response.status_code >= 400:
+                        session.rollback()
+                        break
+                else:
+                    # Each request has its own session, as usual
+                    session.remove()
+        return jsonify(responses)
+
+    def dispatch(self, sub_request: dict) -> Response:
+        headers = {k: v for k, v in request.headers.items() if k in self.FORWARDED_HEADERS}
+        headers.update(sub_request['headers'])
+        builder = EnvironBuilder(path=sub_request['path'],
+                                 base_url=request.host_url + request.script_root.lstrip('/'),
+                                 method=sub_request['method'],
+                                 query_string=sub_request['query'],
+                                 json=sub_request['body'],
+                                 headers=headers)
+        environ = builder.get_environ()
+        environ[self.ENVIRON_KEY] = True
+        with app.request_context(environ):
+            try:
+                return app.full_dispatch_request()
+            except Exception as e:
+                # Keep the responses of the rest of requests
+                app.log_exception(sys.exc_info())
+                error = InternalServerError(original_exception=e)
+                return app.finalize_request(app.handle_http_exception(error),
+                                            from_error_handler=True)
+
+    @staticmethod
+    def dump(response: Response) -> dict:
+        body = response.get_data(as_text=True)
+        if response.is_json and body:
+            body = response.get_json()
+        headers = dict(response.headers)
+        headers.pop('Content-Length', None)
+        return {'status': response.status_code, 'headers': headers, 'body': body}
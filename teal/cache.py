@@ -1,7 +1,16 @@
 import datetime
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
 from functools import wraps
+from itertools import chain
+from threading import Lock
+from typing import Iterable, Optional, Set
 
-from flask import Response, make_response
+from flask import Response, current_app, has_app_context, make_response, request
+from sqlalchemy import event
+from werkzeug.urls import url_encode
 
 
 def cache(expires: datetime.timedelta = None):
@@ -26,3 +35,196 @@ def cache(expires: datetime.timedelta = None):
         return cache_func
 
     return cache_decorator
+
+
+class CacheBackend:
+    """
+    A key-value store with expiring keys used by Teal's server-side
+    caches.
+
+    Subclass it to use a shared store, like Redis or Memcached,
+    so all processes share the same cache. Values must be picklable.
+    """
+
+    def get(self, key: str):
+        """Gets the value of the key, or ``None`` if the key is
+        not set or it expired."""
+        raise NotImplementedError()
+
+    def set(self, key: str, value, ttl: float):
+        """Sets the key for ``ttl`` seconds."""
+        raise NotImplementedError()
+
+    def delete(self, *keys: str):
+        """Deletes the keys, if they are set."""
+        raise NotImplementedError()
+
+
+class LRUCache(CacheBackend):
+    """
+    An in-process, thread-safe, :class:`.CacheBackend` that holds
+    up to ``maxsize`` keys, discarding the least recently used.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._data[key] = time.monotonic() + ttl, value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache:
+    """
+    A server-side cache of the ``GET`` responses of resources.
+
+    Set it in :attr:`teal.resource.Resource.CACHE` and
+    :meth:`teal.resource.View.get` will return the cached responses
+    without executing ``one`` nor ``find``::
+
+        class DeviceDef(Resource):
+            CACHE = ResponseCache(LRUCache(), ttl=60)
+
+    Responses are cached by path, normalized query string,
+    ``Accept`` header and ``Authorization`` credentials, the
+    latter so users only get the responses they are allowed to
+    see. Requests with cookies, which can also identify users,
+    are not cached.
+
+    Committing writes to a model invalidates the responses of its
+    resource type and of the ancestors and descendants of the type
+    in ``app.tree``: writing a Computer invalidates the responses of
+    Device and Computer. Other resources nesting the model are not
+    invalidated; they are refreshed after ``ttl`` seconds.
+
+    Instead of deleting responses, invalidating changes the
+    *generation* of the type, which is part of the keys, so
+    shared backends (see :class:`.CacheBackend`) work with it.
+
+    :param backend: Where to store the responses. By default
+                    an in-process :class:`.LRUCache`.
+    :param ttl: Seconds to keep a response.
+    """
+
+    def __init__(self, backend: CacheBackend = None, ttl: float = 60) -> None:
+        self.backend = backend or LRUCache()
+        self.ttl = ttl
+        self.listen()
+
+    @classmethod
+    def listen(cls):
+        """Invalidates the responses when sessions commit writes.
+
+        Caches call this when created, so sessions of apps
+        without caches do not track their writes.
+        """
+        from teal.db import Session  # teal.db imports this module
+        if not event.contains(Session, 'after_flush', cls.after_flush):
+            event.listen(Session, 'after_flush', cls.after_flush)
+            event.listen(Session, 'after_commit', cls.after_commit)
+            event.listen(Session, 'after_rollback', cls.after_rollback)
+
+    def key(self, type: str) -> Optional[str]:
+        """The key of the response to the current request for
+        a resource of ``type``, or ``None`` if the response
+        cannot be cached, as the request has cookies.
+
+        Get the key before executing the query, so writes committed
+        while building the response invalidate it.
+        """
+        if 'Cookie' in request.headers:
+            return None
+        args = url_encode(sorted(request.args.items(multi=True)))
+        credentials = hashlib.sha256(request.headers.get('Authorization', '').encode())
+        return 'teal:response:{}:{}:{}{}?{}:{}:{}'.format(type, self.generation(type),
+                                                          request.host, request.path, args,
+                                                          request.headers.get('Accept', ''),
+                                                          credentials.hexdigest())
+
+    def generation(self, type: str) -> str:
+        generation_key = 'teal:generation:{}'.format(type)
+        generation = self.backend.get(generation_key)
+        if generation is None:
+            generation = self.invalidate(type)[0]
+        return generation
+
+    def get(self, key: str) -> Optional[Response]:
+        value = self.backend.get(key)
+        if value is not None:
+            data, status, headers = value
+            return Response(data, status, headers)
+
+    def set(self, key: str, response: Response):
+        """Caches the response, if it is a complete 200 one."""
+        session = current_app.db.session
+        if session.registry.has() and session().info.get('teal_response_cache'):
+            return  # The response may show writes that are not committed
+        if response.status_code == 200 and not response.is_streamed:
+            self.backend.set(key,
+                             (response.get_data(), response.status_code,
+                              response.headers.to_wsgi_list()),
+                             self.ttl)
+
+    def invalidate(self, *types: str):
+        """Invalidates the responses of the types.
+
+        :return: The new generations of the types.
+        """
+        generations = []
+        for type in types:
+            generation = uuid.uuid4().hex
+            # Outlive the responses of the generation
+            self.backend.set('teal:generation:{}'.format(type), generation, self.ttl * 2)
+            generations.append(generation)
+        return generations
+
+    @staticmethod
+    def after_flush(session, flush_context):
+        written = session.info.setdefault('teal_response_cache', set())
+        written.update(type(model).__name__
+                       for model in chain(session.new, session.dirty, session.deleted))
+
+    @staticmethod
+    def after_commit(session):
+        written = session.info.pop('teal_response_cache', ())  # type: Set[str]
+        if not written or not has_app_context():
+            return
+        types = set(written)
+        index = getattr(current_app, 'types', None)
+        if index:
+            for t in written:
+                types.update(index.related(t))
+        caches = {r.CACHE for r in getattr(current_app, 'resources', {}).values()
+                  if getattr(r, 'CACHE', None)}  # type: Iterable[ResponseCache]
+        for cache in caches:
+            cache.invalidate(*types)
+
+    @staticmethod
+    def after_rollback(session):
+        session.info.pop('teal_response_cache', None)
@@ -1,7 +1,10 @@
-from typing import Any, Iterable, Tuple, Type, Union
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List, Tuple, Type, Union
 
 from boltons.urlutils import URL
 from ereuse_utils.test import Client as EreuseUtilsClient, JSON, Res
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from werkzeug.exceptions import HTTPException
 
 from teal.marshmallow import ValidationError
@@ -22,14 +25,26 @@ class Client(EreuseUtilsClient):
              content_type=JSON,
              item=None,
              headers: dict = None,
-             token: str = None, **kw) -> Res:
+             token: str = None,
+             max_queries: int = None, **kw) -> Res:
+        """
+        As super, asserting for the type of the error.
+
+        :param max_queries: If set, assert that the request does not
+                            execute more SQL statements than these.
+                            See :meth:`.assert_max_queries`.
+        """
         headers = headers or {}
         if res:
             resource_url = self.application.resources[res].url_prefix + '/'
             uri = URL(uri).navigate(resource_url).to_text()
         if token:
             headers['Authorization'] = 'Basic {}'.format(token)
-        res = super().open(uri, status, query, accept, content_type, item, headers, **kw)
+        if max_queries is not None:
+            with self.assert_max_queries(max_queries):
+                res = super().open(uri, status, query, accept, content_type, item, headers, **kw)
+        else:
+            res = super().open(uri, status, query, accept, content_type, item, headers, **kw)
         # ereuse-utils checks for status code
         # here we check for specific type
         # (when response: {'type': 'foobar', 'code': 422})
@@ -39,6 +54,36 @@ class Client(EreuseUtilsClient):
                 'Expected exception {0} but it was {1}'.format(status.__name__, res[0]['type'])
         return res
 
+    @staticmethod
+    @contextmanager
+    def assert_max_queries(max_queries: int) -> Iterator[List[str]]:
+        """
+        Asserts that the requests performed inside the context
+        do not execute more than ``max_queries`` SQL statements,
+        so N+1 queries fail the tests::
+
+            with client.assert_max_queries(2) as statements:
+                client.get(res='Computer')
+                client.get(res='Computer', item=1)
+
+        The error lists the statements that were executed.
+
+        :return: The statements executed so far.
+        """
+        statements = []  # type: List[str]
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, 'after_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, 'after_cursor_execute', count)
+        assert len(statements) <= max_queries, \
+            'Expected at most {} SQL statements but there were {}:\n{}'.format(
+                max_queries, len(statements), '\n'.join(statements))
+
     def get(self,
             uri: str = '',
             res: str = None,
@@ -0,0 +1,120 @@
+import zlib
+from typing import Iterable, Iterator, Union
+
+from flask import Response, current_app, request
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, install teal[zstd]
+    zstandard = None
+
+
+class Encoder:
+    """Compresses bodies with a ``Content-Encoding``."""
+    name = None  # type: str
+    LEVEL = None  # type: int
+    """The default compression level."""
+
+    def __init__(self, level: int) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def stream(self, chunks: Iterable[Union[bytes, str]]) -> Iterator[bytes]:
+        """Compresses the chunks of a streamed body as they
+        are generated, flushing every chunk to the client."""
+        raise NotImplementedError()
+
+
+class Gzip(Encoder):
+    name = 'gzip'
+    LEVEL = 6
+
+    def _compressobj(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        c = self._compressobj()
+        return c.compress(data) + c.flush()
+
+    def stream(self, chunks: Iterable[Union[bytes, str]]) -> Iterator[bytes]:
+        c = self._compressobj()
+        for chunk in chunks:
+            yield c.compress(chunk.encode() if isinstance(chunk, str) else chunk) \
+                  + c.flush(zlib.Z_SYNC_FLUSH)
+        yield c.flush()
+
+
+class Zstd(Encoder):
+    name = 'zstd'
+    LEVEL = 3
+
+    def compress(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self, chunks: Iterable[Union[bytes, str]]) -> Iterator[bytes]:
+        c = zstandard.ZstdCompressor(level=self.level).compressobj()
+        for chunk in chunks:
+            yield c.compress(chunk.encode() if isinstance(chunk, str) else chunk) \
+                  + c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield c.flush()
+
+
+class Compressor:
+    """
+    Compresses the responses with the encoding the client prefers
+    from its ``Accept-Encoding`` header.
+
+    :class:`teal.teal.Teal` executes it after every request.
+    Configure it through the ``COMPRESS_`` values of
+    :class:`teal.config.Config`. Resources can opt-out through
+    :attr:`teal.resource.Resource.COMPRESS`.
+
+    Streamed responses are always compressed, chunk by chunk;
+    the rest only if they are at least ``COMPRESS_MIN_SIZE`` bytes.
+    """
+    ENCODERS = {
+        Gzip.name: Gzip,
+        Zstd.name: Zstd
+    }
+
+    def __init__(self, config: dict) -> None:
+        levels = config.get('COMPRESS_LEVELS', {})
+        self.encoders = {name: self.ENCODERS[name](levels.get(name, self.ENCODERS[name].LEVEL))
+                         for name in config.get('COMPRESS_ENCODINGS', ())
+                         if name != Zstd.name or zstandard}
+        self.min_size = config.get('COMPRESS_MIN_SIZE', 500)
+        self.mimetypes = set(config.get('COMPRESS_MIMETYPES', ()))
+
+    def __call__(self, response: Response) -> Response:
+        if not self.encoders \
+                or response.mimetype not in self.mimetypes \
+                or response.status_code < 200 or response.status_code in {204, 206, 304} \
+                or response.direct_passthrough \
+                or 'Content-Encoding' in response.headers:
+            return response
+        resource = current_app.resources.get(request.blueprint)
+        if resource is not None and not resource.COMPRESS:
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Accept-Encoding' not in request.headers:
+            return response
+        encoding = request.accept_encodings.best_match(self.encoders)
+        if encoding is None:
+            return response
+        encoder = self.encoders[encoding]
+        if response.is_streamed:
+            response.response = encoder.stream(response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(encoder.compress(data))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is not byte-equal to the original
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
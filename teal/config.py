@@ -1,4 +1,4 @@
-from typing import Dict, Set, Type
+from typing import Dict, Set, Tuple, Type
 
 from boltons.typeutils import issubclass
 
@@ -15,6 +15,12 @@ class Config:
     """
     A list of resource definitions to load.
     """
+    RESOURCE_ENTRY_POINTS = None  # type: str
+    """
+    Optional. An entry point group, like ``teal.resources``, whose
+    resources are loaded too, after the ones in
+    ``RESOURCE_DEFINITIONS``. See :func:`teal.utils.entry_point_resources`.
+    """
 
     SQLALCHEMY_DATABASE_URI = None  # type: str
     """
@@ -26,6 +32,29 @@ class Config:
     /2.3/binds/#referring-to-binds>`_ how bind your models to different
     databases.
     """
+    SQLALCHEMY_REPLICAS = ()  # type: Tuple[str]
+    """
+    Optional. Keys of ``SQLALCHEMY_BINDS`` that are read replicas
+    of the main database. The reads of ``GET`` and ``HEAD`` requests
+    go to a random replica. See :class:`teal.db.Session`.
+    """
+    SQLALCHEMY_REPLICA_STICKINESS = 10
+    """
+    Seconds a client reads from the main database after
+    writing to it, so it can read its own writes.
+    """
+    SQLALCHEMY_REPLICA_MAX_LAG = None  # type: float
+    """
+    Optional. Do not read from replicas that are more than these
+    seconds behind the main database. ``None`` does not check the lag.
+    """
+    SQLALCHEMY_REPLICA_LAG_INTERVAL = 5
+    """Seconds between checks of the lag of a replica."""
+    SQLALCHEMY_ASYNC_WORKERS = 8
+    """
+    Threads executing the database work awaited by coroutines.
+    See :meth:`teal.db.SQLAlchemy.run_sync`.
+    """
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     """
     Disables flask-sqlalchemy notification system. 
@@ -43,6 +72,13 @@ class Config:
     latest/api_core.html#apispec.APISpec>`_. Prefix the configuration
     names with ``API_DOC_CONFIG_``.
     """
+    API_DOC_FILE = None  # type: str
+    """
+    Optional. The path of an OpenApi specification generated with
+    the ``apidocs`` CLI command, served in ``/apidocs``. Set it in
+    production to avoid generating the specification when the
+    app starts.
+    """
     API_DOC_CLASS_DISCRIMINATOR = None
     """
     Configuration options for the api docs class definitions.
@@ -52,6 +88,73 @@ class Config:
     prefiex by ``API_DOC_CLASS_`` like in the example above.
     """
 
+    COMPRESS_ENCODINGS = 'zstd', 'gzip'
+    """
+    The encodings to compress responses with, in order of preference
+    when the client accepts several. ``zstd`` requires the
+    ``zstandard`` package (``teal[zstd]``); an empty tuple disables
+    compression. See :class:`teal.compress.Compressor`.
+    """
+    COMPRESS_LEVELS = {'gzip': 6, 'zstd': 3}
+    """The compression level of each encoding."""
+    COMPRESS_MIN_SIZE = 500
+    """Do not compress non-streamed responses smaller than these bytes."""
+    COMPRESS_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html',
+                          'text/plain'}
+    """The mimetypes of the responses to compress."""
+
+    ASGI_WORKERS = 32
+    """
+    Threads computing responses when serving through ASGI.
+    See :class:`teal.asgi.ASGIApp`.
+    """
+
+    REQUEST_SPOOL_SIZE = 1024 * 1024
+    """
+    Bodies parsed incrementally are kept in memory up to these
+    bytes, and in a temporary file afterwards.
+    See :meth:`teal.request.Request.iter_json`.
+    """
+
+    SERVER_TIMING = False
+    """
+    Time the SQL, loading, dumping and encoding of the requests,
+    reporting it in ``Server-Timing`` headers.
+    See :class:`teal.timing.Timing`.
+    """
+    SERVER_TIMING_LOG = False
+    """Log the timings of every request to the ``teal.timing`` logger."""
+
+    SLOW_QUERY_THRESHOLD = None  # type: float
+    """
+    Log the SQL statements slower than these seconds, with the
+    endpoint executing them. ``None`` disables the log.
+    See :class:`teal.slow_queries.SlowQueryLog`.
+    """
+    SLOW_QUERY_SAMPLE_RATE = 1.0
+    """The fraction of slow statements to log, from 0 to 1."""
+    SLOW_QUERY_MAX_PER_MINUTE = 60
+    """Log at most these slow statements every minute."""
+    SLOW_QUERY_PARAMS_LENGTH = 200
+    """Truncate the logged parameters of statements to these characters."""
+
+    METRICS = False
+    """
+    Expose the latency, sizes and errors of the requests, and the
+    database pools, in ``/metrics`` for Prometheus.
+    See :class:`teal.metrics.Metrics`.
+    """
+    METRICS_LATENCY_BUCKETS = .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10
+    """The upper bounds, in seconds, of the latency histograms."""
+    METRICS_SIZE_BUCKETS = 100, 1000, 10000, 100000, 1000000, 10000000
+    """The upper bounds, in bytes, of the response size histograms."""
+
+    BATCH_MAX_REQUESTS = None  # type: int
+    """
+    Optional. Adds the ``/batch`` endpoint, executing batches of up
+    to this number of requests. See :class:`teal.batch.Batch`.
+    """
+
     CORS_ORIGINS = '*'
     CORS_EXPOSE_HEADERS = 'Authorization'
     CORS_ALLOW_HEADERS = 'Content-Type', 'Authorization'
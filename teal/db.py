@@ -1,22 +1,40 @@
+import asyncio
+import contextvars
 import enum
 import ipaddress
+import random
 import re
+import reprlib
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from distutils.version import StrictVersion
-from typing import Any, Type, Union
+from functools import lru_cache
+from itertools import chain
+from typing import Any, Callable, Tuple, Type, Union
 
 from boltons.typeutils import classproperty
 from boltons.urlutils import URL as BoltonsUrl
 from ereuse_utils import if_none_return_none
+from flask import current_app, g, has_app_context, has_request_context, request
 from flask_sqlalchemy import BaseQuery, Model as _Model, SQLAlchemy as FlaskSQLAlchemy, \
     SignallingSession
-from sqlalchemy import CheckConstraint, SmallInteger, cast, event, types
+from sqlalchemy import CheckConstraint, Column, Index, Integer, SmallInteger, cast, event, func, \
+    inspect, pool, types
 from sqlalchemy.dialects.postgresql import ARRAY, INET
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
-from sqlalchemy_utils import Ltree
-from werkzeug.exceptions import BadRequest, NotFound, UnprocessableEntity
+from sqlalchemy.exc import DBAPIError, IntegrityError, StatementError
+from sqlalchemy.orm import make_transient_to_detached, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound, StaleDataError
+from sqlalchemy.sql import Select, Update, operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from sqlalchemy.util import queue as sqla_queue
+from sqlalchemy_utils import Ltree, LtreeType
+from werkzeug.exceptions import BadRequest, NotFound, PreconditionFailed, UnprocessableEntity
+
+from teal.cache import CacheBackend, LRUCache
 
 
 class ResourceNotFound(NotFound):
@@ -31,6 +49,15 @@ class MultipleResourcesFound(UnprocessableEntity):
         super().__init__('Expected only one {} but multiple where found'.format(resource))
 
 
+class StaleResource(PreconditionFailed):
+    """The resource has been modified by someone else
+    (see :class:`.Versioned`).
+    """
+
+    def __init__(self, description: str = None) -> None:
+        super().__init__(description or 'The resource has been modified since you got it.')
+
+
 POLYMORPHIC_ID = 'polymorphic_identity'
 POLYMORPHIC_ON = 'polymorphic_on'
 INHERIT_COND = 'inherit_condition'
@@ -38,36 +65,337 @@ DEFAULT_CASCADE = 'save-update, merge'
 CASCADE_DEL = '{}, delete'.format(DEFAULT_CASCADE)
 CASCADE_OWN = '{}, delete-orphan'.format(CASCADE_DEL)
 DB_CASCADE_SET_NULL = 'SET NULL'
+VERSION_ID_COL = 'version_id_col'
+
+
+class PKCache:
+    """
+    A read-through cache of models by primary key.
+
+    Set it in :attr:`.Model.PK_CACHE` and :meth:`.Query.one`
+    will get the model from the cache when the query only filters by
+    the primary key, like in ``Device.query.filter_by(id=1).one()``::
+
+        class Device(db.Model):
+            PK_CACHE = PKCache(LRUCache(1000), ttl=60, negative_ttl=5)
+
+    The cache stores the values of the columns, which are merged
+    into the session when read. Relationships are lazy-loaded as usual.
+
+    Subclasses of the model share the cache. Flushing and committing
+    writes to a model invalidates its entries, including the not found
+    ones in its hierarchy. Bulk updates and deletes
+    (``query.update()``...) are not tracked.
+
+    :param backend: Where to store the models. By default
+                    an in-process :class:`teal.cache.LRUCache`.
+    :param ttl: Seconds to keep a model.
+    :param negative_ttl: Seconds to remember that a model does not
+                         exist. ``None`` does not remember it.
+    """
+    NOT_FOUND = 'not found'
+
+    def __init__(self, backend: CacheBackend = None, ttl: float = 300,
+                 negative_ttl: float = None) -> None:
+        self.backend = backend or LRUCache()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.listen()
+
+    @classmethod
+    def listen(cls):
+        """Invalidates the cached models when sessions write them.
+
+        Caches call this when created, so sessions of apps
+        without caches do not track their writes.
+        """
+        if not event.contains(Session, 'after_flush', cls.after_flush):
+            event.listen(Session, 'after_flush', cls.after_flush)
+            event.listen(Session, 'after_commit', cls.after_commit)
+            event.listen(Session, 'after_rollback', cls.after_rollback)
+
+    @staticmethod
+    def key(cls: Type['Model'], pk, schema: str = None) -> str:
+        return 'teal:{}:{}:{}'.format(schema or '', cls.__name__, pk)
+
+    def get(self, query: 'Query', pk):
+        """Gets the model with the primary key ``pk`` from the cache,
+        merged into the session of the ``query``.
+
+        :return: The model, :attr:`.NOT_FOUND` or ``None``.
+        """
+        mapper = query._mapper_zero()
+        schema = getattr(query.session, 'schema', None)
+        value = self.backend.get(self.key(mapper.class_, pk, schema))
+        if value == self.NOT_FOUND:
+            return value
+        value = value or self.backend.get(self.key(mapper.base_mapper.class_, pk, schema))
+        if value is None:
+            return None
+        t, columns = value
+        sub_mapper = next((m for m in mapper.self_and_descendants if m.class_.__name__ == t), None)
+        if sub_mapper is None:  # The model is not a ``mapper``
+            return None
+        model = sub_mapper.class_manager.new_instance()
+        for key, column_value in columns.items():
+            set_committed_value(model, key, column_value)
+        make_transient_to_detached(model)
+        return query.session.merge(model, load=False)
+
+    def set(self, query: 'Query', pk, model: 'Model' = None):
+        """Caches the ``model`` of the primary key ``pk``, or that
+        it does not exist.
+
+        Nothing is cached while the session has flushed writes
+        that are not committed, as they can be rolled back.
+        """
+        if query.session.info.get('teal_pk_cache'):
+            return
+        mapper = query._mapper_zero()
+        schema = getattr(query.session, 'schema', None)
+        if model is None:
+            if self.negative_ttl:
+                self.backend.set(self.key(mapper.class_, pk, schema), self.NOT_FOUND,
+                                 self.negative_ttl)
+        else:
+            state = inspect(model)
+            columns = {p.key: state.dict[p.key]
+                       for p in state.mapper.column_attrs if p.key in state.dict}
+            self.backend.set(self.key(mapper.base_mapper.class_, pk, schema),
+                             (state.mapper.class_.__name__, columns),
+                             self.ttl)
+
+    def invalidate(self, model: 'Model', schema: str = None):
+        """Removes the model, and that it does not exist, from
+        the cache."""
+        state = inspect(model)
+        # New models have no identity until the flush finishes
+        pk = state.identity[0] if state.identity else \
+            state.mapper.primary_key_from_instance(model)[0]
+        if pk is not None:
+            base_mapper = state.mapper.base_mapper
+            self.backend.delete(*(self.key(m.class_, pk, schema)
+                                  for m in base_mapper.self_and_descendants))
+
+    @staticmethod
+    def after_flush(session: 'Session', flush_context):
+        written = session.info.setdefault('teal_pk_cache', set())
+        for model in chain(session.new, session.dirty, session.deleted):
+            if getattr(model, 'PK_CACHE', None) is not None:
+                written.add(model)
+                model.PK_CACHE.invalidate(model, getattr(session, 'schema', None))
+
+    @staticmethod
+    def after_commit(session: 'Session'):
+        # Invalidate again in case a concurrent session cached
+        # the old values between our flush and commit
+        for model in session.info.pop('teal_pk_cache', ()):
+            model.PK_CACHE.invalidate(model, getattr(session, 'schema', None))
+
+    @staticmethod
+    def after_rollback(session: 'Session'):
+        # Concurrent sessions may have cached the rolled back values
+        for model in session.info.pop('teal_pk_cache', ()):
+            model.PK_CACHE.invalidate(model, getattr(session, 'schema', None))
 
 
 class Query(BaseQuery):
+    MODIFIERS = ('_statement', '_from_obj', '_join_entities', '_limit', '_offset', '_distinct',
+                 '_group_by', '_having', '_with_options', '_with_hints', '_params',
+                 '_polymorphic_adapters', '_for_update_arg', '_populate_existing')
+    """
+    The attributes of a query that change what it returns besides
+    its criterion; the primary key cache is only used if they are
+    unset. Missing attributes count as unset.
+    """
+
     def one(self):
+        pk_cache, pk = self._pk_cache()
+        if pk_cache and self._has_pending():
+            # Autoflush has not run yet: the cache does not know them
+            pk_cache = None
+        if pk_cache:
+            model = pk_cache.get(self, pk)
+            if model == PKCache.NOT_FOUND:
+                raise ResourceNotFound(self._entities[0]._label_name)
+            if model is not None:
+                return model
         try:
-            return super().one()
+            model = super().one()
         except NoResultFound:
+            if pk_cache:
+                pk_cache.set(self, pk)
             raise ResourceNotFound(self._entities[0]._label_name)
         except MultipleResultsFound:
             raise MultipleResourcesFound(self._entities[0]._label_name)
+        if pk_cache:
+            pk_cache.set(self, pk, model)
+        return model
+
+    def etag(self, column: Column) -> str:
+        """
+        A weak ETag (without quotes) of the results of this query,
+        from their count and the maximum of ``column``, which has to
+        change when a row is modified (ex. an ``updated`` datetime).
+
+        This does not load the results; use it before paginating
+        with :meth:`teal.resource.View.not_modified`.
+        """
+        last, count = self.order_by(None).with_entities(func.max(column), func.count()).one()
+        return '{}-{}'.format(count, last.isoformat() if hasattr(last, 'isoformat') else last)
+
+    def _pk_cache(self) -> Tuple[Union[PKCache, None], Any]:
+        """Gets the :class:`.PKCache` and primary key of this query,
+        if the query only filters by the primary key of a model that
+        has a cache.
+        """
+        if len(self._entities) != 1 or any(getattr(self, a, None) for a in self.MODIFIERS):
+            return None, None
+        mapper = self._mapper_zero()
+        pk_cache = getattr(getattr(mapper, 'class_', None), 'PK_CACHE', None)
+        criterion = self.whereclause
+        if pk_cache is None \
+                or len(mapper.primary_key) != 1 \
+                or not isinstance(criterion, BinaryExpression) \
+                or criterion.operator is not operators.eq \
+                or not isinstance(criterion.right, BindParameter):
+            return None, None
+        pk_property = mapper.get_property_by_column(mapper.primary_key[0])
+        if mapper._columntoproperty.get(criterion.left) is not pk_property:
+            return None, None
+        return pk_cache, criterion.right.effective_value
+
+    def _has_pending(self) -> bool:
+        """Has the session unflushed changes of models
+        of the hierarchy of the model of this query?"""
+        base = self._mapper_zero().base_mapper.class_
+        session = self.session
+        return any(isinstance(model, base)
+                   for model in chain(session.new, session.dirty, session.deleted))
 
 
 class Model(_Model):
     # Just provide typing
     query_class = Query  # type: Type[Query]
     query = None  # type: Query
+    PK_CACHE = None  # type: PKCache
+    """Optional. Cache models by primary key. See :class:`.PKCache`."""
 
     @classproperty
     def t(cls):
         return cls.__name__
 
 
+class Versioned:
+    """
+    Mixin for models that detect concurrent modifications through
+    a version number, instead of locking rows.
+
+    SQLAlchemy updates the rows only if their version is the one
+    we read, raising an error otherwise, which the :class:`.Session`
+    transforms to :class:`.StaleResource` (412).
+
+    Put it before the ``db.Model``::
+
+        class Device(Versioned, db.Model):
+            ...
+
+    The :attr:`.etag` of the model allows clients to send the version
+    they read in ``If-Match`` headers
+    (see :meth:`teal.resource.View.check_if_match`).
+    """
+    version = Column(Integer, nullable=False)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Sub-models inherit the version_id_col of their parents
+        if not any(hasattr(base, '__mapper__') for base in cls.__mro__[1:]):
+            mapper_args = dict(cls.__dict__.get('__mapper_args__', {}))
+            mapper_args.setdefault(VERSION_ID_COL, cls.version)
+            cls.__mapper_args__ = mapper_args
+
+    @property
+    def etag(self) -> str:
+        """A strong ETag (without quotes) of this version of the model."""
+        return str(self.version)
+
+
 class Session(SignallingSession):
-    """A SQLAlchemy session that raises better exceptions."""
+    """A SQLAlchemy session that raises better exceptions and that
+    can read from replicas.
+
+    If the app sets :attr:`teal.config.Config.SQLALCHEMY_REPLICAS`,
+    the ``SELECT`` statements executed in ``GET`` and ``HEAD`` requests
+    are routed to one of the replicas. Anything else goes to the
+    primary database, as well as any statement executed after
+    the session has written something (read-your-writes).
+    """
+    READ_METHODS = {'GET', 'HEAD'}
+    ATOMIC = 'teal_atomic'
+    """The key in ``info`` set while in :meth:`.atomic`."""
+
+    def __init__(self, db, autocommit=False, autoflush=True, **options):
+        self._db = db
+        self.use_primary = False
+        """
+        Read everything from the primary database. This is set
+        after the first flush, but you can set it too to get fresh
+        values in a request.
+        """
+        super().__init__(db, autocommit, autoflush, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = super().get_bind(mapper, clause)
+        if bind is self.bind and self._reads_from_replica(clause):
+            return self._db.get_replica(self.app) or bind
+        return bind
+
+    def _reads_from_replica(self, clause) -> bool:
+        return bool(self.app.config.get('SQLALCHEMY_REPLICAS')) \
+               and not self.use_primary \
+               and not self._flushing \
+               and isinstance(clause, Select) \
+               and clause._for_update_arg is None \
+               and has_request_context() \
+               and request.method in self.READ_METHODS \
+               and SQLAlchemy.PRIMARY_COOKIE not in request.cookies
+
+    def commit(self):
+        """As super, but only flushing inside :meth:`.atomic`."""
+        if self.info.get(self.ATOMIC):
+            self.flush()
+        else:
+            super().commit()
+
+    @contextmanager
+    def atomic(self):
+        """
+        Executes the block in one transaction, even if the code in it
+        commits: commits only flush, and the transaction is committed
+        at the end of the block, or rolled back if the block raises::
+
+            with db.session().atomic():
+                view1()  # commits
+                view2()  # commits
+        """
+        self.info[self.ATOMIC] = True
+        try:
+            yield self
+        except BaseException:
+            self.info.pop(self.ATOMIC, None)
+            self.rollback()
+            raise
+        self.info.pop(self.ATOMIC, None)
+        self.commit()
 
     def _flush(self, objects=None):
+        self.use_primary = True
         try:
             super()._flush(objects)
         except IntegrityError as e:
             raise DBError(e)  # This creates a suitable subclass
+        except StaleDataError:
+            raise StaleResource()
 
 
 class SchemaSession(Session):
@@ -78,10 +406,64 @@ class SchemaSession(Session):
 
     def __init__(self, db, autocommit=False, autoflush=True, **options):
         super().__init__(db, autocommit, autoflush, **options)
-        self.execute('SET search_path TO {}, public'.format(self.app.schema))
+        self.schema = db.current_schema(self.app)
+        self.execute('SET search_path TO {}, public'.format(self.schema))
+        event.listen(self, 'after_begin', self.set_replica_search_path)
+
+    def set_replica_search_path(self, session, transaction, connection):
+        """Sets the search_path in the connections to replicas."""
+        if connection.engine is not self.bind:
+            connection.execute('SET search_path TO {}, public'.format(self.schema))
 
 
-class StrictVersionType(types.TypeDecorator):
+class MemoizedResult:
+    """
+    Mixin for TypeDecorators that memoizes converting the values
+    from the database in a LRU cache, so the rows that share a value
+    do not convert it again.
+
+    Useful for columns that have few distinct values among many rows.
+    Set the size of the cache per column with the ``cache_size``
+    parameter, or per type with :attr:`.CACHE_SIZE`. By default
+    there is no cache.
+
+    Implement the conversion in :meth:`.convert`.
+    """
+    CACHE_SIZE = None  # type: int
+    """The default size of the cache. ``None`` or ``0`` disables it."""
+    IMMUTABLE = False
+    """
+    Whether the converted values are immutable. Cached values that
+    are not immutable are copied before returning them, so
+    modifying them does not affect other rows.
+    """
+
+    def __init__(self, *args, cache_size: int = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_size = self.CACHE_SIZE if cache_size is None else cache_size
+        self._convert = lru_cache(self.cache_size)(self.convert) \
+            if self.cache_size else self.convert
+
+    @if_none_return_none
+    def process_result_value(self, value, dialect):
+        result = self._convert(value)
+        if self.cache_size and not self.IMMUTABLE:
+            result = self.copy_value(result)
+        return result
+
+    def convert(self, value):
+        """Converts a non-None value from the database."""
+        raise NotImplementedError()
+
+    @staticmethod
+    def copy_value(value):
+        """A shallow copy of a cached value."""
+        copy = value.__class__.__new__(value.__class__)
+        copy.__dict__.update(value.__dict__)
+        return copy
+
+
+class StrictVersionType(MemoizedResult, types.TypeDecorator):
     """StrictVersion support for SQLAlchemy as Unicode.
 
     Idea `from official documentation <http://docs.sqlalchemy.org/en/
@@ -93,12 +475,11 @@ class StrictVersionType(types.TypeDecorator):
     def process_bind_param(self, value, dialect):
         return str(value)
 
-    @if_none_return_none
-    def process_result_value(self, value, dialect):
+    def convert(self, value):
         return StrictVersion(value)
 
 
-class URL(types.TypeDecorator):
+class URL(MemoizedResult, types.TypeDecorator):
     """bolton's URL support for SQLAlchemy as Unicode."""
     impl = types.Unicode
 
@@ -106,27 +487,27 @@ class URL(types.TypeDecorator):
     def process_bind_param(self, value: BoltonsUrl, dialect):
         return value.to_text()
 
-    @if_none_return_none
-    def process_result_value(self, value, dialect):
+    def convert(self, value):
         return BoltonsUrl(value)
 
 
-class IP(types.TypeDecorator):
+class IP(MemoizedResult, types.TypeDecorator):
     """ipaddress support for SQLAlchemy as PSQL INET."""
     impl = INET
+    IMMUTABLE = True
 
     @if_none_return_none
     def process_bind_param(self, value, dialect):
         return str(value)
 
-    @if_none_return_none
-    def process_result_value(self, value, dialect):
+    def convert(self, value):
         return ipaddress.ip_address(value)
 
 
-class IntEnum(types.TypeDecorator):
+class IntEnum(MemoizedResult, types.TypeDecorator):
     """SmallInteger -- IntEnum"""
     impl = SmallInteger
+    IMMUTABLE = True
 
     def __init__(self, enumeration: Type[enum.IntEnum], *args, **kwargs):
         self.enum = enumeration
@@ -137,8 +518,7 @@ class IntEnum(types.TypeDecorator):
         assert isinstance(value, self.enum), 'Value should be instance of {}'.format(self.enum)
         return value.value
 
-    @if_none_return_none
-    def process_result_value(self, value, dialect):
+    def convert(self, value):
         return self.enum(value)
 
 
@@ -163,6 +543,29 @@ class UUIDLtree(Ltree):
         return str(id).replace('-', '_')
 
 
+def move_subtree(column: Column, path: Union[Ltree, str], new_parent: Union[Ltree, str] = None) \
+        -> Update:
+    """
+    Generates a single UPDATE statement that moves the subtree
+    starting at ``path`` under ``new_parent``, rewriting the paths
+    of all its descendants::
+
+        db.session.execute(move_subtree(Lot.path, 'a.b', 'c'))
+        # a.b -> c.b, a.b.d -> c.b.d...
+
+    :param column: The ltree column or attribute.
+    :param new_parent: The path of the new parent. ``None`` moves
+                       the subtree to the root.
+    """
+    column = column.property.columns[0] if hasattr(column, 'property') else column
+    levels = len(str(path).split('.'))
+    rest = func.subpath(column, levels - 1)
+    new_path = rest if new_parent is None else cast(str(new_parent), LtreeType).op('||')(rest)
+    return column.table.update() \
+        .where(column.descendant_of(str(path))) \
+        .values({column: new_path})
+
+
 def check_range(column: str, min=1, max=None) -> CheckConstraint:
     """Database constraint for ranged values."""
     constraint = '>= {}'.format(min) if max is None else 'BETWEEN {} AND {}'.format(min, max)
@@ -175,6 +578,54 @@ def check_lower(field_name: str):
                            name='{} must be lower'.format(field_name))
 
 
+def parse_array(value: str) -> list:
+    """
+    Parses the text representation of a one-dimensional PostgreSQL
+    array, like ``{a,"b c","d\\"e",NULL}``, to a list of strings.
+
+    Quoted elements can have commas, braces and escaped quotes and
+    backslashes. Unquoted ``NULL`` elements are ``None``.
+
+    :raise ValueError: The value is not an array.
+    """
+    if value[:1] == '[':  # Skip the dimensions, as in [0:1]={a,b}
+        value = value[value.find('=') + 1:]
+    if len(value) < 2 or value[0] != '{' or value[-1] != '}':
+        raise ValueError('{!r} is not an array.'.format(value))
+    inner = value[1:-1]
+    if not inner:
+        return []
+    if '"' not in inner:  # Fast path
+        return [None if e == 'NULL' else e for e in inner.split(',')]
+    result = []
+    i, length = 0, len(inner)
+    try:
+        while i < length:
+            if inner[i] == '"':
+                chars = []
+                i += 1
+                while inner[i] != '"':
+                    if inner[i] == '\\':
+                        i += 1
+                    chars.append(inner[i])
+                    i += 1
+                result.append(''.join(chars))
+                i += 1  # Skip the closing quote
+                if i < length and inner[i] != ',':
+                    raise ValueError('{!r} is not an array.'.format(value))
+                i += 1  # Skip the comma
+            else:
+                end = inner.find(',', i)
+                if end == -1:
+                    end = length
+                element = inner[i:end]
+                result.append(None if element == 'NULL' else element)
+                i = end + 1
+    except IndexError:  # An unterminated quote or escape
+        raise ValueError('{!r} is not an array.'.format(value)) from None
+    return result
+
+
 class ArrayOfEnum(ARRAY):
     """
     Allows to use Arrays of Enums for psql.
@@ -183,26 +634,147 @@ class ArrayOfEnum(ARRAY):
     postgresql.html?highlight=array#postgresql-array-of-enum>`_
     and `this issue <https://bitbucket.org/zzzeek/sqlalchemy/issues/
     3467/array-of-enums-does-not-allow-assigning>`_.
+
+    The driver returns these arrays as strings, which we parse
+    with :func:`.parse_array`. With psycopg2, :class:`.SQLAlchemy`
+    registers the arrays of the enums in the connections (see
+    :meth:`.psycopg2_typecaster`), so the driver returns lists,
+    which are used as they are.
     """
 
     def bind_expression(self, bindvalue):
         return cast(bindvalue, self)
 
     def result_processor(self, dialect, coltype):
+        # SQLAlchemy caches this per dialect, so each column type
+        # builds its parser once
         super_rp = super(ArrayOfEnum, self).result_processor(
             dialect, coltype)
-
-        def handle_raw_string(value):
-            inner = re.match(r'^{(.*)}$', value).group(1)
-            return inner.split(',') if inner else []
+        item_rp = self.item_type.dialect_impl(dialect).result_processor(dialect, coltype)
 
         def process(value):
             if value is None:
                 return None
-            return super_rp(handle_raw_string(value))
+            if isinstance(value, str):
+                items = parse_array(value)
+                return [item_rp(item) for item in items] if item_rp else items
+            return super_rp(value)
 
         return process
 
+    @staticmethod
+    def psycopg2_typecaster(metadata):
+        """
+        A ``connect`` listener making psycopg2 return the arrays
+        of the enums of the ArrayOfEnum columns in ``metadata``
+        as lists of strings.
+
+        Enums created after connecting are parsed
+        by :func:`.parse_array` instead.
+        """
+
+        def register(dbapi_connection, connection_record):
+            from psycopg2 import extensions  # Only with the psycopg2 driver
+            names = tuple({column.type.item_type.name
+                           for table in metadata.tables.values()
+                           for column in table.columns
+                           if isinstance(column.type, ArrayOfEnum)
+                           and getattr(column.type.item_type, 'name', None)})
+            if not names:
+                return
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute('SELECT typname, typarray FROM pg_type WHERE typname IN %s',
+                               (names,))
+                for name, oid in cursor.fetchall():
+                    array = extensions.new_array_type((oid,), '{}[]'.format(name),
+                                                      extensions.UNICODE)
+                    extensions.register_type(array, dbapi_connection)
+            finally:
+                cursor.close()
+                dbapi_connection.rollback()
+
+        return register
+
+
+class _TimedQueue(sqla_queue.Queue):
+    """The queue of connections of :class:`.QueuePool`,
+    accounting the time threads wait in :meth:`.get`."""
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.wait_time = 0.0
+        self._wait_lock = threading.Lock()
+
+    def get(self, block=True, timeout=None):
+        start = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            with self._wait_lock:
+                self.wait_time += time.perf_counter() - start
+
+
+class QueuePool(pool.QueuePool):
+    """
+    A :class:`sqlalchemy.pool.QueuePool` that accounts the time
+    threads wait for a connection to be returned to the pool
+    in :attr:`.wait_time`; creating connections does not count.
+
+    :class:`.SQLAlchemy` uses it instead of the default pool of
+    SQLAlchemy, so :class:`teal.metrics.Metrics` can report it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = _TimedQueue(self._pool.maxsize)
+
+    @property
+    def wait_time(self) -> float:
+        """The seconds spent waiting for connections, in total."""
+        return self._pool.wait_time
+
+
+def time_statements(engine):
+    """
+    Times the SQL statements of the engine, passing them to the
+    ``statement_observers`` of the current app, like
+    :class:`teal.timing.Timing` and :class:`teal.slow_queries.SlowQueryLog`,
+    as ``observer(statement, parameters, duration, rows)``.
+
+    Statements that fail are observed too, with zero rows. The
+    start of a statement is kept in its execution context, which
+    is discarded with the statement even if it fails.
+
+    :class:`.SQLAlchemy` sets this in the engines of
+    apps with observers.
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._teal_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _observe(context, statement, parameters, max(cursor.rowcount, 0))
+
+
+def _handle_error(exception_context):
+    _observe(exception_context.execution_context, exception_context.statement,
+             exception_context.parameters, 0)
+
+
+def _observe(context, statement, parameters, rows: int):
+    start = context.__dict__.pop('_teal_start', None) if context is not None else None
+    if start is not None and has_app_context():
+        duration = time.perf_counter() - start
+        for observer in getattr(current_app, 'statement_observers', ()):
+            observer(statement, parameters, duration, rows)
+
 
 class SQLAlchemy(FlaskSQLAlchemy):
     """
@@ -216,15 +788,159 @@ class SQLAlchemy(FlaskSQLAlchemy):
     UUIDLtree = UUIDLtree
     ArrayOfEnum = ArrayOfEnum
 
+    PRIMARY_COOKIE = 'teal_primary'
+    """
+    The cookie that makes the requests of a client read from
+    the primary database after the client has written.
+    """
+    REPLICA_LAG_QUERY = 'SELECT COALESCE(EXTRACT(EPOCH FROM ' \
+                        'now() - pg_last_xact_replay_timestamp()), 0)'
+    """A statement returning the seconds a replica is behind."""
+
     def __init__(self, app=None, use_native_unicode=True, session_options=None, metadata=None,
                  query_class=BaseQuery, model_class=Model):
+        self._replica_lags = {}
+        self._executor = None  # type: ThreadPoolExecutor
+        self._executor_lock = threading.Lock()
         super().__init__(app, use_native_unicode, session_options, metadata, query_class,
                          model_class)
 
+    def init_app(self, app):
+        super().init_app(app)
+        if app.config.get('SQLALCHEMY_REPLICAS'):
+            app.after_request(self.stick_to_primary)
+
+    def create_all(self, bind='__all__', app=None):
+        """As super, but indexing ltree columns with GiST.
+
+        See :meth:`.index_ltree_columns`.
+        """
+        self.index_ltree_columns()
+        super().create_all(bind, app)
+
+    def index_ltree_columns(self):
+        """
+        Adds a GiST index to the ltree columns without one, so
+        ancestor and descendant queries (see
+        :class:`teal.query.LtreeField`) can use it.
+        """
+        for table in self.Model.metadata.tables.values():
+            indexed = {column
+                       for index in table.indexes if index.kwargs.get('postgresql_using') == 'gist'
+                       for column in index.columns}
+            for column in table.columns:
+                if isinstance(column.type, LtreeType) and column not in indexed:
+                    Index('{}_{}_gist'.format(table.name, column.name), column,
+                          postgresql_using='gist')
+
+    def create_engine(self, sa_url, engine_opts):
+        """As super, but using our :class:`.QueuePool` where
+        SQLAlchemy would use its QueuePool, and registering the
+        arrays of enums in psycopg2 connections (see
+        :meth:`.ArrayOfEnum.psycopg2_typecaster`)."""
+        if 'poolclass' not in engine_opts and 'pool' not in engine_opts \
+                and sa_url.get_dialect().get_pool_class(sa_url) is pool.QueuePool:
+            engine_opts = dict(engine_opts, poolclass=QueuePool)
+        engine = super().create_engine(sa_url, engine_opts)
+        if engine.dialect.driver == 'psycopg2':
+            event.listen(engine, 'connect', ArrayOfEnum.psycopg2_typecaster(self.Model.metadata))
+        return engine
+
+    def get_engine(self, app=None, bind=None):
+        """As super, but timing the statements of the engine
+        if the app has ``statement_observers``
+        (see :func:`.time_statements`)."""
+        engine = super().get_engine(app, bind)
+        if getattr(self.get_app(app), 'statement_observers', None):
+            with self._engine_lock:
+                if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                    time_statements(engine)
+        return engine
+
     def create_session(self, options):
         """As parent's create_session but adding our Session."""
         return sessionmaker(class_=Session, db=self, **options)
 
+    def get_replica(self, app=None):
+        """
+        Gets the engine of a random replica from
+        :attr:`teal.config.Config.SQLALCHEMY_REPLICAS`, skipping the
+        ones that lag more than ``SQLALCHEMY_REPLICA_MAX_LAG``.
+
+        :return: The engine or ``None`` if there is no suitable replica.
+        """
+        app = self.get_app(app)
+        engines = [self.get_engine(app, key) for key in app.config['SQLALCHEMY_REPLICAS']]
+        max_lag = app.config.get('SQLALCHEMY_REPLICA_MAX_LAG')
+        if max_lag is not None:
+            interval = app.config.get('SQLALCHEMY_REPLICA_LAG_INTERVAL', 5)
+            engines = [e for e in engines if self.replica_lag(e, interval) <= max_lag]
+        return random.choice(engines) if engines else None
+
+    def replica_lag(self, engine, interval: float = 5) -> float:
+        """
+        The seconds the replica is behind the primary database,
+        checked at most once per ``interval`` seconds.
+
+        Replicas that cannot be checked have an infinite lag.
+        """
+        checked_at, lag = self._replica_lags.get(engine, (None, None))
+        now = time.monotonic()
+        if checked_at is None or now - checked_at > interval:
+            try:
+                lag = float(engine.scalar(self.REPLICA_LAG_QUERY))
+            except DBAPIError:
+                lag = float('inf')
+            self._replica_lags[engine] = now, lag
+        return lag
+
+    async def run_sync(self, fn: Callable, *args, **kwargs):
+        """
+        Awaits ``fn(*args, **kwargs)``, a function using the database,
+        executing it in a pool of ``SQLALCHEMY_ASYNC_WORKERS``
+        threads so it does not block the event loop of a coroutine;
+        for example in ``async def`` views::
+
+            async def one(self, id):
+                return await db.run_sync(self.one_sync, id)
+
+        The function runs with a copy of the current contexts (app,
+        request, :meth:`SchemaSQLAlchemy.tenant`...) and with its own
+        session, which is removed afterwards: commit and serialize
+        the models inside the function.
+        """
+        app = self.get_app()
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        app.config.get('SQLALCHEMY_ASYNC_WORKERS', 8),
+                        thread_name_prefix='teal-db'
+                    )
+
+        def call():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.session.remove()
+
+        context = contextvars.copy_context()
+        return await asyncio.get_event_loop().run_in_executor(self._executor, context.run, call)
+
+    def stick_to_primary(self, response):
+        """
+        Sets :attr:`.PRIMARY_COOKIE` when the request has written
+        to the database, so the following requests of the client
+        read from the primary for ``SQLALCHEMY_REPLICA_STICKINESS``
+        seconds, as replicas may not have the changes yet.
+        """
+        if self.session.registry.has() and getattr(self.session(), 'use_primary', False):
+            app = self.get_app()
+            response.set_cookie(self.PRIMARY_COOKIE, '1',
+                                max_age=app.config.get('SQLALCHEMY_REPLICA_STICKINESS', 10),
+                                httponly=True)
+        return response
+
 
 class SchemaSQLAlchemy(SQLAlchemy):
     """
@@ -233,6 +949,8 @@ class SchemaSQLAlchemy(SQLAlchemy):
 
     See :attr:`teal.config.SCHEMA` for more info.
     """
+    TENANT = '_tenant'
+    """The variable in ``g`` set by :meth:`.tenant`."""
 
     def __init__(self, app=None, use_native_unicode=True, session_options=None, metadata=None,
                  query_class=Query, model_class=Model):
@@ -283,16 +1001,66 @@ class SchemaSQLAlchemy(SQLAlchemy):
         extend-create_all-drop_all-to-include#comment-40129850>`_.
         """
         schemas = set(table.schema for table in target.tables.values() if table.schema)
-        if self._app.schema:
-            schemas.add(self._app.schema)
+        schema = self.current_schema(self._app)
+        if schema:
+            schemas.add(schema)
         for schema in schemas:
             connection.execute('CREATE SCHEMA IF NOT EXISTS {}'.format(schema))
         self.set_search_path(target, connection)
 
     def set_search_path(self, _, connection, **kw):
-        app = self.get_app()
-        if app.schema:
-            connection.execute('SET search_path TO {}, public'.format(app.schema))
+        schema = self.current_schema()
+        if schema:
+            connection.execute('SET search_path TO {}, public'.format(schema))
+
+    def current_schema(self, app=None) -> str:
+        """
+        The schema of the app, or the one set with :meth:`.tenant`
+        in this app context.
+        """
+        return (has_app_context() and g.get(self.TENANT)) or self.get_app(app).schema
+
+    @contextmanager
+    def tenant(self, schema: str):
+        """
+        Uses ``schema`` instead of the schema of the app in the
+        current app context, so an app can work with the schemas of
+        other tenants::
+
+            with app.app_context(), db.tenant('foo'):
+                db.create_all()
+        """
+        previous = g.get(self.TENANT)
+        setattr(g, self.TENANT, schema)
+        try:
+            yield
+        finally:
+            setattr(g, self.TENANT, previous)
+
+    def clone_schema(self, template: str, app=None):
+        """
+        Copies the rows of the tables in the ``template`` schema to
+        the ones in the current schema, in a single transaction.
+
+        Use it to provision a tenant after creating its tables,
+        instead of executing :meth:`teal.resource.Resource.init_db`,
+        by initializing once the template with it.
+
+        Only the tables that live in the schema of the tenant are
+        copied (not the ones with an explicit schema), and their
+        sequences are moved past the copied ids.
+        """
+        schema = self.current_schema(app)
+        tables = [t for t in self.Model.metadata.sorted_tables if t.schema is None]
+        with self.engine.begin() as conn:
+            for table in tables:
+                conn.execute('INSERT INTO {0}.{2} SELECT * FROM {1}.{2}'
+                             .format(schema, template, table.name))
+                column = table._autoincrement_column
+                if column is not None:
+                    conn.execute("SELECT setval(pg_get_serial_sequence('{0}.{1}', '{2}'), "
+                                 "COALESCE(MAX({2}), 0) + 1, false) FROM {0}.{1}"
+                                 .format(schema, table.name, column.name))
 
     def revert_connection(self, _, connection, **kw):
         connection.execute('SET search_path TO public')
@@ -303,8 +1071,7 @@ class SchemaSQLAlchemy(SQLAlchemy):
 
     def drop_schema(self, app=None, schema=None):
         """Nukes a schema and everything that depends on it."""
-        app = self.get_app(app)
-        schema = schema or app.schema
+        schema = schema or self.current_schema(app)
         with self.engine.begin() as conn:
             conn.execute('DROP SCHEMA IF EXISTS {} CASCADE'.format(schema))
 
@@ -324,26 +1091,69 @@ class DBError(BadRequest):
     as a client-ready HTTP Error.
 
     When instantiating the class it auto-selects the best error.
+
+    The error is selected through the SQLSTATE of the DBAPI error
+    (``pgcode`` in psycopg2) or, for databases without it
+    like SQLite, through the message of the DBAPI error. We avoid
+    ``str(origin)`` as it contains the statement and all its
+    parameters, which is huge on batched inserts.
     """
+    UNIQUE_VIOLATION = '23505'
+    """The SQLSTATE of unique violations."""
+    PARAMS_REPR = reprlib.Repr()
+    """Truncates the parameters shown in the description."""
+    PARAMS_REPR.maxlist = PARAMS_REPR.maxtuple = PARAMS_REPR.maxdict = 5
+    PARAMS_REPR.maxstring = PARAMS_REPR.maxother = 40
 
     def __init__(self, origin: IntegrityError):
-        super().__init__(str(origin))
+        description = str(self.dbapi_error(origin)).strip()
+        if isinstance(origin, StatementError) and origin.params:
+            description += ' [parameters: {}]'.format(self.PARAMS_REPR.repr(origin.params))
+        super().__init__(description)
         self._origin = origin
 
     def __new__(cls, origin: IntegrityError) -> Any:
-        msg = str(origin)
-        if 'unique constraint' in msg.lower():
+        error = cls.dbapi_error(origin)
+        pgcode = getattr(error, 'pgcode', None)
+        if pgcode == cls.UNIQUE_VIOLATION \
+                or pgcode is None and 'unique constraint' in str(error).lower():
             return super().__new__(UniqueViolation)
         return super().__new__(cls)
 
+    @staticmethod
+    def dbapi_error(origin: IntegrityError) -> Exception:
+        """The error of the DBAPI driver that originated ``origin``."""
+        return getattr(origin, 'orig', None) or origin
+
 
 class UniqueViolation(DBError):
+    SQLITE = re.compile(r'UNIQUE constraint failed: (?:\w+\.)?(\w+)')
+    """Gets the (first) column from SQLite's messages."""
+    PSQL_DETAIL = re.compile(r'Key \((.*)\)=\((.*)\)')
+    """Gets the column and value from PostgreSQL's message detail."""
+
     def __init__(self, origin: IntegrityError):
         super().__init__(origin)
-        self.constraint = self.description.split('"')[1]
+        error = self.dbapi_error(origin)
+        self.constraint = None
         self.field_name = None
         self.field_value = None
-        if isinstance(origin.params, dict):
-            self.field_name, self.field_value = next(
-                (k, v) for k, v in origin.params.items() if k in self.constraint
-            )
+        diag = getattr(error, 'diag', None)
+        if diag is not None:  # psycopg2
+            self.constraint = diag.constraint_name
+            match = self.PSQL_DETAIL.search(diag.message_detail or '')
+            if match:
+                self.field_name, self.field_value = match.groups()
+        else:
+            msg = str(error)
+            match = self.SQLITE.search(msg)
+            if match:
+                self.constraint = self.field_name = match.group(1)
+            elif '"' in msg:
+                self.constraint = msg.split('"')[1]
+            params = getattr(origin, 'params', None)
+            if isinstance(params, dict) and self.constraint:
+                self.field_name, self.field_value = next(
+                    ((k, v) for k, v in params.items() if k in self.constraint),
+                    (self.field_name, None)
+                )
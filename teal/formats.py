@@ -0,0 +1,131 @@
+from typing import Optional, Tuple, Type
+
+from flask import Response, current_app, jsonify, request
+from werkzeug.exceptions import BadRequest
+
+from teal import timing
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency, install teal[msgpack]
+    msgpack = None
+try:
+    import cbor2
+except ImportError:  # Optional dependency, install teal[cbor]
+    cbor2 = None
+
+JSON = 'application/json'
+
+
+class Format:
+    """
+    A binary alternative to JSON for the bodies of requests and
+    responses, negotiated through ``Content-Type`` and ``Accept``.
+
+    Formats encode the same values than
+    :class:`teal.json_util.TealJSONEncoder`: datetimes, UUIDs, enums...
+    are strings, sets are lists, etc.
+    """
+    MIMETYPES = ()  # type: Tuple[str]
+    """The mimetypes of the format; the first one is used in responses."""
+
+    @classmethod
+    def available(cls) -> bool:
+        """Is the library of the format installed?"""
+        raise NotImplementedError()
+
+    @classmethod
+    def dumps(cls, value) -> bytes:
+        raise NotImplementedError()
+
+    @classmethod
+    def loads(cls, data: bytes):
+        raise NotImplementedError()
+
+    @staticmethod
+    def default(value):
+        """Converts a value the format does not know to one it does."""
+        return current_app.json_encoder().default(value)
+
+
+class MessagePack(Format):
+    MIMETYPES = 'application/msgpack', 'application/x-msgpack'
+
+    @classmethod
+    def available(cls) -> bool:
+        return msgpack is not None
+
+    @classmethod
+    def dumps(cls, value) -> bytes:
+        # msgpack only calls default with the types that are not JSON
+        return msgpack.packb(value, default=cls.default, use_bin_type=True)
+
+    @classmethod
+    def loads(cls, data: bytes):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CBOR(Format):
+    MIMETYPES = 'application/cbor',
+
+    @classmethod
+    def available(cls) -> bool:
+        return cbor2 is not None
+
+    @classmethod
+    def dumps(cls, value) -> bytes:
+        # CBOR natively encodes datetimes, sets... differently than JSON
+        return cbor2.dumps(cls.jsonable(value))
+
+    @classmethod
+    def loads(cls, data: bytes):
+        return cbor2.loads(data)
+
+    @classmethod
+    def jsonable(cls, value):
+        """Converts the value, recursively, to the types of JSON."""
+        if value is None or isinstance(value, (str, bool, int, float)):
+            return value
+        if isinstance(value, dict):
+            return {k: cls.jsonable(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls.jsonable(v) for v in value]
+        return cls.jsonable(cls.default(value))
+
+
+FORMATS = MessagePack, CBOR
+"""The formats Teal negotiates, besides JSON."""
+
+
+def request_format() -> Optional[Type[Format]]:
+    """The format of the body of the request, if not JSON."""
+    return next((f for f in FORMATS if request.mimetype in f.MIMETYPES and f.available()), None)
+
+
+def response_format() -> Optional[Type[Format]]:
+    """The format the client prefers for responses, if not JSON."""
+    formats = {mimetype: f for f in FORMATS if f.available() for mimetype in f.MIMETYPES}
+    best = request.accept_mimetypes.best_match((JSON,) + tuple(formats), default=JSON)
+    return formats.get(best)
+
+
+def load(data: bytes, format: Type[Format]):
+    try:
+        return format.loads(data)
+    except Exception as e:
+        raise BadRequest('The body is not valid {}: {}'.format(format.__name__, e))
+
+
+def make_response(value, status: int = None) -> Response:
+    """Like Flask's ``jsonify`` but encoding the value in the format
+    the client prefers through ``Accept``."""
+    format = response_format()
+    with timing.measure('encode'):
+        if format:
+            response = Response(format.dumps(value), mimetype=format.MIMETYPES[0])
+        else:
+            response = jsonify(value)
+    if status is not None:
+        response.status_code = status
+    response.vary.add('Accept')
+    return response
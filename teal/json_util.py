@@ -1,8 +1,14 @@
+import codecs
+import json
+from typing import IO, Iterator
+
 import ereuse_utils
 from flask.json import JSONEncoder as FlaskJSONEncoder
 from sqlalchemy.ext.baked import Result
 from sqlalchemy.orm import Query
 
+CHUNK_SIZE = 64 * 1024
+
 
 class TealJSONEncoder(ereuse_utils.JSONEncoder, FlaskJSONEncoder):
 
@@ -10,3 +16,84 @@ class TealJSONEncoder(ereuse_utils.JSONEncoder, FlaskJSONEncoder):
         if isinstance(obj, (Result, Query)):
             return tuple(obj)
         return super().default(obj)
+
+
+def iter_ndjson(file: IO[bytes]) -> Iterator:
+    """Parses the values of a file of newline-delimited JSON,
+    one line at a time."""
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line.decode())
+
+
+def iter_json_array(file: IO[bytes], chunk_size: int = CHUNK_SIZE,
+                    max_item_size: int = None) -> Iterator:
+    """
+    Parses the items of a file with a JSON array, reading only
+    ``chunk_size`` bytes and an item at a time.
+
+    An item that does not parse is read again with at least as
+    many characters as are buffered, so big items take linear
+    time to parse.
+
+    :param max_item_size: Give up on the items that do not parse
+                          with this many characters buffered.
+    :raise ValueError: The file is not a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer, i, eof = '', 0, False
+    expecting = '['  # [, first (value or ]), value, or ,]
+
+    def read(size=chunk_size):
+        nonlocal buffer, i, eof
+        chunk = file.read(size)
+        eof = not chunk
+        if i > len(buffer) // 2:  # Compact when most of the buffer is parsed
+            buffer, i = buffer[i:], 0
+        buffer += utf8.decode(chunk, final=eof)
+
+    def read_more():
+        """Reads at least as much as the buffered item."""
+        pending = len(buffer) - i
+        if max_item_size is not None and pending > max_item_size:
+            raise ValueError('An item is not valid JSON after {} characters.'
+                             .format(max_item_size))
+        read(max(chunk_size, pending))
+
+    while True:
+        while i < len(buffer) and buffer[i].isspace():
+            i += 1
+        if i == len(buffer):
+            if eof:
+                raise ValueError('The JSON array is incomplete.')
+            read()
+            continue
+        char = buffer[i]
+        if expecting == '[':
+            if char != '[':
+                raise ValueError('The body is not a JSON array.')
+            i += 1
+            expecting = 'first'
+        elif char == ']' and expecting in {'first', ',]'}:
+            return
+        elif expecting == ',]':
+            if char != ',':
+                raise ValueError('Expected , or ] but got {}.'.format(char))
+            i += 1
+            expecting = 'value'
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, i)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            if not eof and (end == len(buffer) or buffer[end] not in ',] \t\r\n'):
+                read_more()  # The value may be truncated, like a number
+                continue
+            yield value
+            i = end
+            expecting = ',]'
@@ -190,7 +190,7 @@ class NestedOn(MarshmallowNested):
         if isinstance(value, dict) and self.polymorphic_on in value:
             type = value[self.polymorphic_on]
             resource = app.resources[type]
-            if not issubclass(resource.SCHEMA, parent_schema):
+            if type not in app.types.schema_descendants(parent_schema.t):
                 raise ValidationError('{} is not a sub-type of {}'.format(type, parent_schema.t),
                                       field_names=[attr])
             schema = resource.SCHEMA(only=self.only,
@@ -249,13 +249,10 @@ class IsType(Validator):
 
     def __call__(self, type: str):
         assert not self.parent or self.parent in app.resources
-        try:
-            r = app.resources[type]
-            if self.parent:
-                if not issubclass(r.__class__, app.resources[self.parent].__class__):
-                    raise ValidationError(self.no_subtype.format(self.parent))
-        except KeyError:
+        if type not in app.resources:
             raise ValidationError(self.no_type)
+        if self.parent and not app.types.is_subtype(type, self.parent):
+            raise ValidationError(self.no_subtype.format(parent=self.parent))
 
 
 class ValidationError(_ValidationError):
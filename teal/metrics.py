@@ -0,0 +1,259 @@
+import threading
+import weakref
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from flask import Flask, Response, current_app, request
+from flask_sqlalchemy import get_state
+from sqlalchemy import pool
+
+Labels = Tuple[str, ...]
+
+
+class Metric:
+    """
+    A metric in the `Prometheus text format
+    <https://prometheus.io/docs/instrumenting/exposition_formats/>`_.
+
+    Threads update their own copy of the values, without locks;
+    the copies are added up when exposing them. The copies of
+    finished threads are added to a base copy, so thread-per-request
+    servers do not accumulate them.
+    """
+    TYPE = None  # type: str
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._local = threading.local()
+        self._base = {}  # type: dict
+        self._shards = []  # type: List[dict]
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        """The values of the current thread."""
+        try:
+            return self._local.owner.values
+        except AttributeError:
+            # Once per thread
+            owner = self._local.owner = _ShardOwner()
+            values = owner.values = {}
+            with self._lock:
+                self._shards.append(values)
+            # The thread-local owner is collected when the thread ends
+            weakref.finalize(owner, self._fold, values)
+            return values
+
+    def _fold(self, values: dict):
+        """Adds the values of a finished thread to the base."""
+        with self._lock:
+            self._shards = [shard for shard in self._shards if shard is not values]
+            for labels, value in values.items():
+                self._base[labels] = self._add(self._base.get(labels), value)
+
+    @staticmethod
+    def _add(total, value):
+        """Adds two values of the metric; ``total`` can be None."""
+        raise NotImplementedError()
+
+    def _values(self) -> Iterator[Tuple[Labels, object]]:
+        with self._lock:
+            shards = list(self._shards)
+            base = list(self._base.items())
+        yield from base
+        for shard in shards:
+            yield from list(shard.items())
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        """The (suffix, labels, value) of the samples of the metric."""
+        raise NotImplementedError()
+
+    def expose(self) -> Iterator[str]:
+        yield '# HELP {} {}'.format(self.name, self.help)
+        yield '# TYPE {} {}'.format(self.name, self.TYPE)
+        for suffix, labels, value in self.samples():
+            yield '{}{}{} {}'.format(self.name, suffix, self._labels(labels), _number(value))
+
+    def _labels(self, values: Labels, names: Tuple[str, ...] = None) -> str:
+        names = names or self.labels
+        if not values:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(n, _escape(v)) for n, v in zip(names, values)) + '}'
+
+
+class _ShardOwner:
+    """Holds the values of a thread; a dict cannot be weak-referenced."""
+    __slots__ = 'values', '__weakref__'
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _add(total, value):
+        return (total or 0) + value
+
+    def samples(self):
+        totals = {}
+        for labels, value in self._values():
+            totals[labels] = self._add(totals.get(labels), value)
+        for labels, value in sorted(totals.items()):
+            yield '', labels, value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: Labels, value: float):
+        shard = self._shard()
+        try:
+            counts = shard[labels]
+        except KeyError:
+            # A count per bucket, +Inf, and the sum of the values
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @staticmethod
+    def _add(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self):
+        totals = {}
+        for labels, counts in self._values():
+            totals[labels] = self._add(totals.get(labels), counts)
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', labels + (bound,), cumulative
+            yield '_sum', labels, counts[-1]
+            yield '_count', labels, cumulative
+
+    def _labels(self, values: Labels, names: Tuple[str, ...] = None) -> str:
+        if len(values) > len(self.labels):  # A bucket
+            return super()._labels(values[:-1] + (_number(values[-1]),), self.labels + ('le',))
+        return super()._labels(values, names)
+
+
+class Gauge(Metric):
+    """A metric whose values are read from a function when exposed."""
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 read: Callable[[], Iterable[Tuple[Labels, float]]]) -> None:
+        super().__init__(name, help, labels)
+        self.read = read
+
+    def samples(self):
+        for labels, value in self.read():
+            yield '', labels, value
+
+
+class Metrics:
+    """
+    Measures the requests of an app and exposes the measures
+    in the ``/metrics`` endpoint, in the Prometheus text format:
+
+    - The latency and size of the responses, by resource type
+      (or endpoint, for non-resources) and HTTP method.
+    - The errors, by resource type and exception.
+    - The connection pools of the database engines: connections
+      checked out, overflow connections and the time spent waiting
+      for connections, for the pools that report them (see
+      :class:`teal.db.QueuePool`).
+
+    :class:`teal.teal.Teal` sets this through ``METRICS``.
+    The endpoint is public; restrict it in your proxy if needed.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        self.app = app
+        labels = 'resource', 'method'
+        self.latency = Histogram('teal_request_duration_seconds',
+                                 'The time to compute the responses.',
+                                 labels, app.config['METRICS_LATENCY_BUCKETS'])
+        self.size = Histogram('teal_response_size_bytes',
+                              'The size of the non-streamed responses.',
+                              labels, app.config['METRICS_SIZE_BUCKETS'])
+        self.errors = Counter('teal_errors_total',
+                              'The errors returned to clients.',
+                              ('resource', 'method', 'exception'))
+        self.metrics = [
+            self.latency,
+            self.size,
+            self.errors,
+            Gauge('teal_db_pool_checked_out', 'Database connections in use.',
+                  ('bind',), lambda: self._pools(lambda p: p.checkedout())),
+            Gauge('teal_db_pool_overflow', 'Database connections over the size of the pool.',
+                  ('bind',), lambda: self._pools(lambda p: max(p.overflow(), 0))),
+            Gauge('teal_db_pool_wait_seconds', 'The time spent waiting for connections.',
+                  ('bind',), lambda: self._pools(lambda p: p.wait_time, 'wait_time'))
+        ]
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.add_url_rule('/metrics', 'metrics', view_func=self.endpoint, methods={'GET'})
+
+    @staticmethod
+    def _resource() -> str:
+        return request.blueprint or request.endpoint or ''
+
+    ENVIRON_KEY = 'teal.metrics'
+
+    def before_request(self):
+        # In the environ, so requests inside requests
+        # (ex. in a batch) do not overwrite it
+        request.environ[self.ENVIRON_KEY] = perf_counter()
+
+    def after_request(self, response: Response) -> Response:
+        start = request.environ.pop(self.ENVIRON_KEY, None)
+        if start is not None:
+            labels = self._resource(), request.method
+            self.latency.observe(labels, perf_counter() - start)
+            if response.content_length is not None:
+                self.size.observe(labels, response.content_length)
+        return response
+
+    def error(self, e: Exception):
+        """Counts an error; the error handlers of Teal call this."""
+        e = getattr(e, 'original_exception', None) or e  # Unhandled errors
+        self.errors.inc((self._resource(), request.method, e.__class__.__name__))
+
+    def _pools(self, read: Callable[[pool.QueuePool], float], attr: str = None):
+        """Reads the pools of the engines the app has created so far."""
+        for bind, connector in sorted(get_state(self.app).connectors.items(),
+                                      key=lambda item: item[0] or ''):
+            p = connector.get_engine().pool
+            if isinstance(p, pool.QueuePool) and (attr is None or hasattr(p, attr)):
+                yield (bind or 'default',), read(p)
+
+    def expose(self) -> str:
+        return '\n'.join(line for metric in self.metrics for line in metric.expose()) + '\n'
+
+    def endpoint(self) -> Response:
+        """The metrics, in the Prometheus text format."""
+        return current_app.response_class(self.expose(),
+                                          mimetype='text/plain; version=0.0.4')
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
@@ -1,10 +1,11 @@
 import json
 from json import JSONDecodeError
+from typing import Tuple
 
 from ereuse_utils import flatten_mixed
 from marshmallow import Schema as MarshmallowSchema
-from marshmallow.fields import Boolean, Field, List, Nested, Str, missing_
-from sqlalchemy import Column, between, or_
+from marshmallow.fields import Boolean, Field, Integer, List, Nested, Str, missing_
+from sqlalchemy import Column, between, func, or_
 from webargs.flaskparser import FlaskParser
 
 
@@ -103,6 +104,81 @@ class ILike(Str):
         return self.column.ilike('{}%'.format(v))
 
 
+class LtreeField(Str):
+    """
+    Base class for fields generating statements for PostgreSQL's
+    ltree columns, like the ones storing :class:`teal.db.UUIDLtree`.
+
+    The value is a path of labels separated by dots. As a commodity,
+    the hyphens of UUIDs are replaced by underscores, so you can
+    pass UUIDs as they are.
+    """
+
+    def __init__(self, column: Column,
+                 default=missing_, attribute=None, data_key=None, error=None, validate=None,
+                 required=False, allow_none=None, load_only=False, dump_only=False,
+                 missing=missing_, error_messages=None, **metadata):
+        super().__init__(default=default, attribute=attribute, data_key=data_key, error=error,
+                         validate=validate, required=required, allow_none=allow_none,
+                         load_only=load_only, dump_only=dump_only, missing=missing,
+                         error_messages=error_messages, **metadata)
+        self.column = column
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        v = super()._deserialize(value, attr, data, **kwargs)
+        return self.clause(v.replace('-', '_'))
+
+    def clause(self, path: str):
+        raise NotImplementedError()
+
+
+class AncestorOf(LtreeField):
+    """
+    Generates an ltree ``@>`` statement, getting the rows whose path
+    is an ancestor of the passed-in path (or the path itself).
+    """
+
+    def clause(self, path: str):
+        return self.column.ancestor_of(path)
+
+
+class DescendantOf(LtreeField):
+    """
+    Generates an ltree ``<@`` statement, getting the rows whose path
+    is a descendant of the passed-in path (or the path itself); this is
+    the subtree of the path.
+    """
+
+    def clause(self, path: str):
+        return self.column.descendant_of(path)
+
+
+class LQuery(LtreeField):
+    """
+    Generates an ltree ``~`` statement, matching paths
+    with a `lquery <https://www.postgresql.org/docs/current/ltree.html>`_
+    like ``*.foo.*{1}``.
+    """
+
+    def clause(self, path: str):
+        return self.column.lquery(path)
+
+
+class Depth(Integer):
+    """
+    Generates a statement getting the rows whose ltree path
+    has the passed-in number of labels; 1 being the roots.
+    """
+
+    def __init__(self, column: Column, **kwargs):
+        super().__init__(**kwargs)
+        self.column = column
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        v = super()._deserialize(value, attr, data, **kwargs)
+        return func.nlevel(self.column) == v
+
+
 class QueryField(Field):
     """A field whose first parameter is a function that when
     executed by passing only the value returns a SQLAlchemy query
@@ -180,8 +256,8 @@ class Sort(MarshmallowSchema):
     DESCENDING = False
     """Sort in descending order."""
 
-    def load(self, data, many=None, partial=None):
-        values = super().load(data, many=many, partial=partial).values()
+    def load(self, data, many=None, partial=None, unknown=None):
+        values = super().load(data, many=many, partial=partial, unknown=unknown).values()
         return flatten_mixed(values)
 
 
@@ -197,6 +273,29 @@ class SortField(Boolean):
         return self.column.asc() if v else self.column.desc()
 
 
+def find_clauses(find_args: MarshmallowSchema, args: dict) -> Tuple[list, list]:
+    """
+    Gets the SQLAlchemy clauses from the already loaded ``args``
+    of a :attr:`teal.resource.View.FindArgs`.
+
+    Only the nested :class:`.Query` and :class:`.Sort` fields are
+    used; the rest of the arguments (ex. pagination) are ignored.
+
+    :return: A tuple with 1. the filter clauses and 2. the order
+             clauses.
+    """
+    filters, order = [], []
+    for name, field in find_args.fields.items():
+        value = args.get(field.attribute or name)
+        if value is None or not isinstance(field, Nested):
+            continue
+        if isinstance(field.schema, Query):
+            filters.extend(value)
+        elif isinstance(field.schema, Sort):
+            order.extend(value)
+    return filters, order
+
+
 class NestedQueryFlaskParser(FlaskParser):
     """
     Parses JSON-encoded URL parameters like
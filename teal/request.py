@@ -1,9 +1,17 @@
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterator, Optional
+
 from flask import Request as _Request, current_app as app
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
 
+from teal import formats
+from teal.json_util import CHUNK_SIZE, iter_json_array, iter_ndjson
 from teal.resource import Schema
 
 
 class Request(_Request):
+    NDJSON = 'application/x-ndjson'
+
     def get_json(self, force=False,
                  silent=False,
                  cache=True,
@@ -13,8 +21,83 @@ class Request(_Request):
         As :meth:`flask.Request.get_json` but parsing
         the resulting json through passed-in ``schema`` (or by default
         ``g.schema``).
+
+        Bodies in other formats, like MessagePack, are decoded
+        too. See :mod:`teal.formats`.
         """
-        json = super().get_json(force, silent, cache)
+        format = formats.request_format()
+        if format:
+            json = formats.load(self.get_data(cache=cache), format)
+        else:
+            json = super().get_json(force, silent, cache)
         if validate:
             json = schema.load(json) if schema else app.resources[self.blueprint].schema.load(json)
         return json
+
+    @property
+    def max_body_size(self) -> Optional[int]:
+        """The maximum bytes of the body: the ``MAX_BODY_SIZE`` of
+        the resource, or Flask's ``MAX_CONTENT_LENGTH``."""
+        resource = app.resources.get(self.blueprint)
+        return getattr(resource, 'MAX_BODY_SIZE', None) or self.max_content_length
+
+    def spool(self) -> IO[bytes]:
+        """
+        Reads the body into a temporary file that is in memory
+        until ``REQUEST_SPOOL_SIZE`` bytes, and in disk afterwards.
+
+        :raise RequestEntityTooLarge: The body is bigger than
+                                      :attr:`.max_body_size`.
+        """
+        max_size = self.max_body_size
+        if max_size is not None and (self.content_length or 0) > max_size:
+            raise RequestEntityTooLarge()
+        file = SpooledTemporaryFile(max_size=app.config.get('REQUEST_SPOOL_SIZE', 1024 * 1024))
+        size = 0
+        for chunk in iter(lambda: self.stream.read(CHUNK_SIZE), b''):
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                file.close()
+                raise RequestEntityTooLarge()
+            file.write(chunk)
+        file.seek(0)
+        return file
+
+    def iter_json(self, schema: Schema = None, batch_size=100) -> Iterator[list]:
+        """
+        Parses a body with many resources without having it
+        all in memory, yielding batches of up to ``batch_size``
+        resources loaded through ``schema`` (by default the one
+        of the resource)::
+
+            for devices in request.iter_json():
+                db.session.add_all(Device(**d) for d in devices)
+                db.session.flush()
+
+        The body is a JSON array, or newline-delimited JSON if the
+        ``Content-Type`` is ``application/x-ndjson``. It is spooled
+        (see :meth:`.spool`) and then parsed one resource at a time.
+
+        :raise RequestEntityTooLarge: The body has more than the
+                                      ``MAX_ITEMS`` of the resource.
+        """
+        schema = schema or app.resources[self.blueprint].schema
+        max_items = getattr(app.resources.get(self.blueprint), 'MAX_ITEMS', None)
+        with self.spool() as file:
+            values = iter_ndjson(file) if self.mimetype == self.NDJSON \
+                else iter_json_array(file, max_item_size=self.max_body_size)
+            batch, count = [], 0
+            try:
+                for value in values:
+                    count += 1
+                    if max_items is not None and count > max_items:
+                        raise RequestEntityTooLarge('The body has more than {} items.'
+                                                    .format(max_items))
+                    batch.append(value)
+                    if len(batch) == batch_size:
+                        yield schema.load(batch, many=True)
+                        batch = []
+            except ValueError as e:
+                raise BadRequest('The body is not valid JSON: {}'.format(e))
+            if batch:
+                yield schema.load(batch, many=True)
@@ -1,19 +1,24 @@
+import csv
+import warnings
 from enum import Enum
-from typing import Callable, Iterable, Iterator, Tuple, Type, Union
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple, Type, Union
 
 import inflection
-from anytree import PreOrderIter
+import werkzeug
+from anytree import Node, PreOrderIter
+from boltons.cacheutils import cachedproperty
 from boltons.typeutils import classproperty, issubclass
+from click import BadParameter, Choice, File, option
 from ereuse_utils.naming import Naming
-from flask import Blueprint, current_app, g, request, url_for
-from flask.json import jsonify
+from flask import Blueprint, Response, current_app, g, json, request, url_for
 from flask.views import MethodView
 from marshmallow import Schema as MarshmallowSchema, SchemaOpts as MarshmallowSchemaOpts, \
     ValidationError, post_dump, pre_load, validates_schema
-from werkzeug.exceptions import MethodNotAllowed
-from werkzeug.routing import UnicodeConverter
+from werkzeug.exceptions import MethodNotAllowed, RequestEntityTooLarge
+from werkzeug.routing import Rule, UnicodeConverter
 
-from teal import db, query
+from teal import db, formats, query, timing
+from teal.cache import ResponseCache
 
 
 class SchemaOpts(MarshmallowSchemaOpts):
@@ -120,6 +125,10 @@ class Schema(MarshmallowSchema):
         if nested is not None:
             setattr(g, NestedOn.NESTED_LEVEL, 0)
             setattr(g, NestedOn.NESTED_LEVEL_MAX, nested)
+        with timing.measure('dump'):
+            return self._dump(model, many, polymorphic_on)
+
+    def _dump(self, model, many, polymorphic_on):
         if many:
             # todo this breaks with normal dicts. Maybe this should go
             # in NestedOn in the same way it happens when loading
@@ -134,28 +143,40 @@ class Schema(MarshmallowSchema):
             else:
                 return self._polymorphic_dump(model, polymorphic_on)
 
+    def load(self, data, many=None, partial=None, unknown=None):
+        with timing.measure('load'):
+            return super().load(data, many=many, partial=partial, unknown=unknown)
+
     def _polymorphic_dump(self, obj: 'db.Model', polymorphic_on='t'):
         schema = current_app.resources[getattr(obj, polymorphic_on)].schema
         if schema.t != self.t:
-            return super(schema.__class__, schema).dump(obj, False)
+            return MarshmallowSchema.dump(schema, obj, many=False)
         else:
-            return super().dump(obj, False)
+            return super().dump(obj, many=False)
 
     def jsonify(self,
                 model: Union['db.Model', Iterable['db.Model']],
                 nested=1,
                 many=False,
-                update_fields: bool = True,
+                update_fields: bool = None,
                 polymorphic_on='t',
                 **kw) -> str:
         """
         Like flask's jsonify but with model / marshmallow schema
         support.
 
+        The response is JSON, or MessagePack or CBOR if the client
+        prefers them. See :mod:`teal.formats`.
+
         :param nested: How many layers of nested relationships to load?
                        By default only loads 1 nested relationship.
+        :param update_fields: Deprecated and ignored, as Marshmallow 3
+                              does not update fields when dumping.
         """
-        return jsonify(self.dump(model, many, update_fields, nested, polymorphic_on))
+        if update_fields is not None:
+            warnings.warn('update_fields is ignored and will be removed',
+                          DeprecationWarning, stacklevel=2)
+        return formats.make_response(self.dump(model, many, nested, polymorphic_on))
 
 
 class View(MethodView):
@@ -163,6 +184,13 @@ class View(MethodView):
     A REST interface for resources.
     """
     QUERY_PARSER = query.NestedQueryFlaskParser()
+    ETAG = True
+    """
+    Add to ``GET`` responses without ETag a strong one hashing
+    their body, so clients can avoid downloading unmodified
+    resources through ``If-None-Match``. See :meth:`.not_modified`
+    to avoid the work of serializing them too.
+    """
 
     class FindArgs(MarshmallowSchema):
         """
@@ -176,6 +204,7 @@ class View(MethodView):
         self.schema = None  # type: Schema
         """The schema tied to this view."""
         self.find_args = self.FindArgs()
+        self._etag = None  # type: Optional[Tuple[str, bool]]
         super().__init__()
 
     def dispatch_request(self, *args, **kwargs):
@@ -200,15 +229,73 @@ class View(MethodView):
           200:
             description: Return the collection or the specific one.
         """
-        if id:
-            response = self.one(id)
+        cache = self.resource_def.CACHE  # type: ResponseCache
+        key = cache.key(self.resource_def.type) if cache else None
+        if key:
+            response = cache.get(key)
+            if response is not None:
+                return response.make_conditional(request)
+        # one and find can be coroutines, as the rest of methods
+        if id is not None:
+            response = current_app.ensure_sync(self.one)(id)
         else:
             args = self.QUERY_PARSER.parse(self.find_args,
                                            request,
                                            locations=('querystring',))
-            response = self.find(args)
+            response = current_app.ensure_sync(self.find)(args)
+        response = self._set_etag(response)
+        if key:
+            cache.set(key, response)
+        return response.make_conditional(request)
+
+    def not_modified(self, etag: str, weak=False) -> Optional[Response]:
+        """
+        Sets the ETag of the response of ``one`` or ``find``,
+        returning a ``304 Not Modified`` response if the client
+        already has it, so you can skip serializing the resources::
+
+            def one(self, id):
+                device = Device.query.filter_by(id=id).one()
+                return self.not_modified(device.etag) or self.schema.jsonify(device)
+
+            def find(self, args: dict):
+                query = Device.query.filter(*filters)
+                return self.not_modified(query.etag(Device.updated), weak=True) \\
+                       or self.schema.jsonify(query.all(), many=True)
+
+        Use the ``etag`` of :class:`teal.db.Versioned` models and
+        the weak :meth:`teal.db.Query.etag` of collections.
+        """
+        self._etag = etag, weak
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak)
+            return response
+
+    def _set_etag(self, response) -> Response:
+        """Sets the ETag of a ``GET`` response."""
+        response = current_app.make_response(response)  # type: Response
+        if response.status_code == 200 and 'ETag' not in response.headers:
+            if self._etag:
+                response.set_etag(*self._etag)
+            elif self.ETAG and not response.is_streamed:
+                response.add_etag()
         return response
 
+    @staticmethod
+    def check_if_match(model: 'db.Versioned'):
+        """
+        Ensures that the client modifies the version of the model it
+        has, if it sent an ``If-Match`` header, raising
+        :class:`teal.db.StaleResource` (412) otherwise.
+
+        Call it in ``put`` and ``patch`` before modifying the model.
+        Concurrent modifications that happen afterwards are detected
+        when flushing.
+        """
+        if request.if_match and not request.if_match.contains(model.etag):
+            raise db.StaleResource()
+
     def one(self, id):
         """GET one specific resource (ex. /cars/1)."""
         raise MethodNotAllowed()
@@ -248,6 +335,30 @@ class LowerStrConverter(UnicodeConverter):
         return super().to_python(value).lower()
 
 
+class LazyRule(Rule):
+    """
+    A URL rule that compiles the functions building its URLs
+    (for ``url_for``) the first time they are used, instead of when
+    the rule is added, which is most of the cost of adding rules.
+
+    This overrides a private method of Werkzeug 2.0, the version
+    ``setup.py`` pins. :class:`teal.teal.Teal` uses plain rules
+    with other versions (see :attr:`.SUPPORTED`).
+    """
+    SUPPORTED = werkzeug.__version__.startswith('2.0.')
+    """Whether the installed Werkzeug is the one this works with."""
+
+    def _compile_builder(self, append_unknown=True):
+        name = '_build_unknown' if append_unknown else '_build'
+
+        def build(rule: Rule, *args, **kwargs):
+            compiled = Rule._compile_builder(rule, append_unknown).__get__(rule, None)
+            setattr(rule, name, compiled)
+            return compiled(*args, **kwargs)
+
+        return build
+
+
 class Resource(Blueprint):
     """
     Main resource class. Defines the schema, views,
@@ -264,6 +375,35 @@ class Resource(Blueprint):
     """
     SCHEMA = Schema  # type: Type[Schema]
     """The Schema that validates a submitting resource at the entry point."""
+    MODEL = None  # type: Type[db.Model]
+    """The SQLAlchemy model of this resource, if any."""
+    EXPORT = True
+    """
+    If true and the resource has a ``MODEL`` and a ``SCHEMA``, generate
+    an ``export`` command in the CLI group of this resource.
+    See :meth:`.export`.
+    """
+    CACHE = None  # type: ResponseCache
+    """
+    Optional. Cache the ``GET`` responses of this resource in
+    the server. See :class:`teal.cache.ResponseCache`.
+    """
+    COMPRESS = True
+    """
+    Compress the responses of this resource, if the client accepts it.
+    See :class:`teal.compress.Compressor`.
+    """
+    MAX_BODY_SIZE = None  # type: int
+    """
+    Optional. The maximum bytes of the body of the requests,
+    instead of Flask's ``MAX_CONTENT_LENGTH``. Bigger requests
+    are rejected before reading them.
+    """
+    MAX_ITEMS = None  # type: int
+    """
+    Optional. The maximum resources in a body parsed
+    through :meth:`teal.request.Request.iter_json`.
+    """
     AUTH = False
     """
     If true, authentication is required for all the endpoints of this
@@ -308,7 +448,6 @@ class Resource(Blueprint):
         #   and it is not very elegant...
 
         self.app = app
-        self.schema = self.SCHEMA() if self.SCHEMA else None
         # Views
         if self.VIEW:
             view = self.VIEW.as_view('main', definition=self, auth=app.auth)
@@ -318,9 +457,16 @@ class Resource(Blueprint):
             self.add_url_rule('/', view_func=view, methods={'POST'})
             self.add_url_rule('/<{}:{}>'.format(self.ID_CONVERTER.value, self.ID_NAME),
                               view_func=view, methods={'GET', 'PUT', 'DELETE', 'PATCH'})
-        self.cli_commands = cli_commands
+        self.cli_commands = tuple(cli_commands)
+        if self.EXPORT and self.MODEL and self.SCHEMA:
+            self.cli_commands += ((self.export, 'export'),)
         self.before_request(self.load_resource)
 
+    @cachedproperty
+    def schema(self) -> Optional[Schema]:
+        """The instance of ``SCHEMA``, created on first use."""
+        return self.SCHEMA() if self.SCHEMA else None
+
     @classproperty
     def type(cls):
         t = cls.__type__ or cls.SCHEMA.t
@@ -348,6 +494,8 @@ class Resource(Blueprint):
         """
         g.schema = self.schema
         g.resource_def = self
+        if self.MAX_BODY_SIZE is not None and (request.content_length or 0) > self.MAX_BODY_SIZE:
+            raise RequestEntityTooLarge()
 
     def init_db(self, db: 'db.SQLAlchemy', exclude_schema=None):
         """
@@ -360,10 +508,133 @@ class Resource(Blueprint):
         """
         pass
 
+    @option('--format', 'fmt',
+            type=Choice(('ndjson', 'csv')),
+            default='ndjson',
+            help='The output format.')
+    @option('--output', '-o',
+            type=File('w'),
+            default='-',
+            help='The file to write to. By default the standard output.')
+    @option('--query', '-q', 'json_query',
+            default=None,
+            help='A JSON object with the arguments of the FindArgs of the view, '
+                 'like in the querystring of a GET collection.')
+    @option('--columns', '-c',
+            default=None,
+            help='Comma-separated column names. If set, export only these columns '
+                 'straight from the database, skipping the schema (faster).')
+    @option('--nested',
+            default=0,
+            help='How many layers of nested relationships to dump.')
+    @option('--batch-size',
+            default=1000,
+            help='How many rows to fetch from the database at once.')
+    def export(self, fmt: str, output, json_query: str = None, columns: str = None, nested=0,
+               batch_size=1000):
+        """
+        Exports the resources, optionally filtered, to NDJSON or CSV.
+
+        Rows are streamed from a server-side cursor in batches of
+        ``batch-size`` and written as they come, so memory usage
+        does not depend on the size of the collection.
+        """
+        find_args = (self.VIEW or View).FindArgs()
+        try:
+            args = find_args.load(json.loads(json_query) if json_query else {})
+        except (ValueError, ValidationError) as e:
+            raise BadParameter(str(e), param_hint='--query')
+        filters, order = query.find_clauses(find_args, args)
+        q = self.MODEL.query.filter(*filters).order_by(*order)
+        if columns:
+            names = columns.split(',')
+            attrs = self.MODEL.__mapper__.column_attrs
+            for name in names:
+                if name not in attrs:
+                    raise BadParameter('{} has no column {}'.format(self.type, name),
+                                       param_hint='--columns')
+            q = q.with_entities(*(getattr(self.MODEL, name) for name in names))
+            rows = (dict(zip(names, row)) for row in self._stream(q, batch_size))
+        else:
+            names = [f.data_key or n for n, f in self.schema.fields.items() if not f.load_only]
+            rows = (self.schema.dump(model, nested=nested)
+                    for model in self._stream(q, batch_size))
+        if fmt == 'csv':
+            writer = csv.DictWriter(output, names, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({k: self._csv_value(v) for k, v in row.items()})
+        else:
+            for row in rows:
+                output.write(json.dumps(row))
+                output.write('\n')
+
+    @staticmethod
+    def _stream(q: 'db.Query', batch_size: int) -> 'db.Query':
+        return q.execution_options(stream_results=True).yield_per(batch_size)
+
+    @staticmethod
+    def _csv_value(value):
+        if isinstance(value, (dict, list, tuple)):
+            return json.dumps(value)
+        return value
+
     @property
-    def subresources_types(self) -> Iterator[str]:
-        """Gets the types of the subresources."""
-        return (node.name for node in PreOrderIter(self.app.tree[self.t]))
+    def subresources_types(self) -> Tuple[str, ...]:
+        """Gets the types of the subresources, this one included."""
+        return self.app.types.subtypes[self.t]
+
+
+class TypeIndex:
+    """
+    The hierarchy of the resource types of an app, precomputed
+    from :attr:`teal.teal.Teal.tree` once the resources are loaded,
+    so validating and querying types does not walk the tree::
+
+        'Computer' in app.types.descendants['Device']  # True
+        Device.query.filter(Device.type.in_(app.types.subtypes['Device']))
+
+    The index is frozen: it does not change if the tree does.
+    """
+
+    def __init__(self, resources: Dict[str, 'Resource'], tree: Dict[str, Node]) -> None:
+        self.resources = resources
+        self.subtypes = {t: tuple(n.name for n in PreOrderIter(node))
+                         for t, node in tree.items()}  # type: Dict[str, Tuple[str, ...]]
+        """The type and its descendants, as a polymorphic ``IN`` list."""
+        self.descendants = {t: frozenset(subtypes)
+                            for t, subtypes in self.subtypes.items()}  # type: Dict[str, FrozenSet[str]]
+        """The type and its descendants, for membership checks."""
+        self.ancestors = {t: tuple(n.name for n in reversed(node.path))
+                          for t, node in tree.items()}  # type: Dict[str, Tuple[str, ...]]
+        """The type and its ancestors, from the type to the root."""
+        self._schema_descendants = {}  # type: Dict[str, FrozenSet[str]]
+
+    def is_subtype(self, type: str, parent: str) -> bool:
+        """Is ``type`` the ``parent`` type or one of its descendants?"""
+        descendants = self.descendants.get(parent)
+        return descendants is not None and type in descendants
+
+    def related(self, type: str) -> FrozenSet[str]:
+        """The type, its ancestors and its descendants."""
+        return self.descendants.get(type, frozenset()).union(self.ancestors.get(type, ()))
+
+    def schema_descendants(self, type: str) -> FrozenSet[str]:
+        """
+        The types whose schema is the schema of ``type``
+        or a subclass of it.
+
+        Schemas usually follow the hierarchy of the resources
+        but they do not have to, so this is computed, once per type,
+        from the schemas.
+        """
+        try:
+            return self._schema_descendants[type]
+        except KeyError:
+            schema = self.resources[type].SCHEMA
+            types = frozenset(t for t, r in self.resources.items()
+                              if r.SCHEMA and issubclass(r.SCHEMA, schema))
+            return self._schema_descendants.setdefault(type, types)
 
 
 TYPE = Union[Resource, Schema, 'db.Model', str, Type[Resource], Type[Schema], Type['db.Model']]
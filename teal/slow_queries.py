@@ -0,0 +1,89 @@
+import json
+import logging
+import random
+import reprlib
+from threading import Lock
+from time import monotonic
+
+from flask import Flask, current_app, g, has_request_context, request
+
+log = logging.getLogger(__name__)
+
+
+class SlowQueryLog:
+    """
+    Logs the SQL statements slower than ``SLOW_QUERY_THRESHOLD``
+    seconds to the ``teal.slow_queries`` logger, as JSON, with
+    the endpoint that executed them::
+
+        {"duration": 1.52, "statement": "SELECT ...",
+         "parameters": "{'id_1': 3, ...", "resource": "Computer",
+         "endpoint": "Computer.main", "handler": "find", "method": "GET",
+         "path": "/computers/"}
+
+    Parameters are truncated to ``SLOW_QUERY_PARAMS_LENGTH``
+    characters. To keep the log cheap, only a
+    ``SLOW_QUERY_SAMPLE_RATE`` fraction of the slow statements
+    are logged, and up to ``SLOW_QUERY_MAX_PER_MINUTE`` every
+    minute; the next message logged says how many were dropped.
+
+    :class:`teal.teal.Teal` sets this when there
+    is a ``SLOW_QUERY_THRESHOLD``.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD']  # type: float
+        self.sample_rate = app.config.get('SLOW_QUERY_SAMPLE_RATE', 1.0)
+        self.max_per_minute = app.config.get('SLOW_QUERY_MAX_PER_MINUTE', 60)
+        self.params_length = app.config.get('SLOW_QUERY_PARAMS_LENGTH', 200)
+        # Bulk statements have many parameters: do not repr all of them
+        self.params_repr = reprlib.Repr()
+        self.params_repr.maxstring = self.params_repr.maxother = self.params_length
+        self.params_repr.maxlist = self.params_repr.maxtuple = self.params_repr.maxdict = 10
+        self._lock = Lock()
+        self._minute = None
+        self._logged = 0
+        self.dropped = 0
+        """The slow statements not logged by the rate limit."""
+        app.slow_query_log = self
+        app.statement_observers.append(self.observe_statement)
+
+    def observe_statement(self, statement: str, parameters, duration: float, rows: int):
+        if duration >= self.threshold:
+            self.record(statement, parameters, duration)
+
+    def record(self, statement: str, parameters, duration: float):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        with self._lock:
+            minute = int(monotonic() // 60)
+            if minute != self._minute:
+                self._minute, self._logged = minute, 0
+            if self._logged >= self.max_per_minute:
+                self.dropped += 1
+                return
+            self._logged += 1
+            dropped, self.dropped = self.dropped, 0
+        params = self.params_repr.repr(parameters)
+        if len(params) > self.params_length:
+            params = params[:self.params_length] + '...'
+        entry = {'duration': round(duration, 3), 'statement': statement, 'parameters': params}
+        if has_request_context():
+            resource_def = g.get('resource_def')
+            view = current_app.view_functions.get(request.endpoint)
+            handler = None
+            if getattr(view, 'view_class', None):
+                # Resource views answer GET with one or find
+                handler = request.method.lower()
+                if handler == 'get' and resource_def:
+                    # The collection sets the id to None
+                    id = (request.view_args or {}).get(resource_def.ID_NAME)
+                    handler = 'find' if id is None else 'one'
+            entry.update(resource=resource_def.type if resource_def else None,
+                         endpoint=request.endpoint,
+                         handler=handler,
+                         method=request.method,
+                         path=request.path)
+        if dropped:
+            entry['dropped'] = dropped
+        log.warning(json.dumps(entry))
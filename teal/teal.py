@@ -1,29 +1,39 @@
+import gzip
+import hashlib
 import inspect
-from typing import Dict, Type
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, TYPE_CHECKING, Tuple, Type
 
 import click_spinner
 import ereuse_utils
 import flask_cors
 from anytree import Node
-from apispec import APISpec
-from apispec_webframeworks.flask import FlaskPlugin
-from apispec.ext.marshmallow import MarshmallowPlugin
-from click import option
+from click import File, option
 from ereuse_utils import ensure_utf8
-from flask import Flask, jsonify
+from flask import Flask, Response, current_app, json, jsonify, request
 from flask.globals import _app_ctx_stack
 from flask_sqlalchemy import SQLAlchemy
 from marshmallow import ValidationError
 from werkzeug.exceptions import HTTPException, UnprocessableEntity
+from werkzeug.routing import Rule
 
 from teal.auth import Auth
+from teal.batch import Batch
 from teal.cli import TealCliRunner
 from teal.client import Client
+from teal.compress import Compressor
 from teal.config import Config as ConfigClass
 from teal.db import SchemaSQLAlchemy
 from teal.json_util import TealJSONEncoder
+from teal.metrics import Metrics
 from teal.request import Request
-from teal.resource import Converters, LowerStrConverter, Resource
+from teal.resource import Converters, LazyRule, LowerStrConverter, Resource, TypeIndex
+from teal.slow_queries import SlowQueryLog
+from teal.timing import Timing
+from teal.utils import entry_point_resources
+
+if TYPE_CHECKING:
+    from apispec import APISpec
 
 
 class Teal(Flask):
@@ -34,6 +44,7 @@ class Teal(Flask):
     test_client_class = Client
     request_class = Request
     json_encoder = TealJSONEncoder
+    url_rule_class = LazyRule if LazyRule.SUPPORTED else Rule
     cli_context_settings = {'help_option_names': ('-h', '--help')}
     test_cli_runner_class = TealCliRunner
 
@@ -101,11 +112,22 @@ class Teal(Flask):
         self.load_resources()
         self.register_error_handler(HTTPException, self._handle_standard_error)
         self.register_error_handler(ValidationError, self._handle_validation_error)
+        self.after_request(Compressor(self.config))
+        self.statement_observers = []  # type: List[Callable]
+        """The functions observing the SQL statements of this app
+        (see :func:`teal.db.time_statements`)."""
+        if self.config.get('SERVER_TIMING'):
+            Timing(self)
+        if self.config.get('SLOW_QUERY_THRESHOLD') is not None:
+            SlowQueryLog(self)
+        self.metrics = Metrics(self) if self.config.get('METRICS') else None  # type: Metrics
         self.db = db
         db.init_app(self)
         if use_init_db:
             self.cli.command('init-db', context_settings=self.cli_context_settings)(self.init_db)
-        self.spec = None  # type: APISpec
+        if self.config.get('BATCH_MAX_REQUESTS'):
+            self.add_url_rule('/batch', 'batch', view_func=Batch(), methods={'POST'})
+        self.spec = None  # type: Optional[APISpec]
         self.apidocs()
 
     # noinspection PyAttributeOutsideInit
@@ -126,7 +148,11 @@ class Teal(Flask):
         schemas (for example, an extension that is only added on the
         third app adds a new type of user).
         """
-        for ResourceDef in self.config['RESOURCE_DEFINITIONS']:
+        definitions = list(self.config['RESOURCE_DEFINITIONS'])
+        group = self.config.get('RESOURCE_ENTRY_POINTS')
+        if group:
+            definitions += [r for r in entry_point_resources(group) if r not in definitions]
+        for ResourceDef in definitions:
             resource_def = ResourceDef(self)  # type: Resource
             self.register_blueprint(resource_def)
 
@@ -153,12 +179,16 @@ class Teal(Flask):
             _, Parent, *superclasses = inspect.getmro(resource_def.__class__)
             if Parent is not Resource:
                 node.parent = self.tree[Parent.type]
+        self.types = TypeIndex(self.resources, self.tree)
+        """The hierarchy of :attr:`.tree`, precomputed for fast lookups."""
 
     @staticmethod
     def _handle_standard_error(e: HTTPException):
         """
         Handles HTTPExceptions by transforming them to JSON.
         """
+        if current_app.metrics:
+            current_app.metrics.error(e)
         try:
             response = jsonify(e)
             response.status_code = e.code
@@ -174,6 +204,8 @@ class Teal(Flask):
 
     @staticmethod
     def _handle_validation_error(e: ValidationError):
+        if current_app.metrics:
+            current_app.metrics.error(e)
         data = {
             'message': e.messages,
             'code': UnprocessableEntity.code,
@@ -190,7 +222,20 @@ class Teal(Flask):
             default=None,
             help='Schema to exclude creation (and deletion if --erase is set). '
                  'Required the SchemaSQLAlchemy.')
-    def init_db(self, erase: bool = False, exclude_schema=None):
+    @option('--tenant', '-t', 'tenants',
+            multiple=True,
+            help='Initialize the schema of this tenant instead of the one of the app. '
+                 'Repeat it to initialize several tenants concurrently. '
+                 'Requires the SchemaSQLAlchemy.')
+    @option('--jobs', '-j',
+            default=4,
+            help='How many tenants to initialize at the same time.')
+    @option('--template',
+            default=None,
+            help='An initialized schema to copy the rows of the tenants from, '
+                 'instead of executing the init_db of the resources.')
+    def init_db(self, erase: bool = False, exclude_schema=None, tenants=tuple(), jobs=4,
+                template=None):
         """
         Initializes a database from scratch,
         creating tables and needed resources.
@@ -204,19 +249,47 @@ class Teal(Flask):
         Resource.load_resource`.
         """
         assert _app_ctx_stack.top, 'Use an app context.'
+        if tenants:
+            self._init_tenants(tenants, jobs, erase, exclude_schema, template)
+            return
         print('Initializing database...'.ljust(30), end='')
         with click_spinner.spinner():
-            if erase:
-                if exclude_schema:  # Using then a schema teal sqlalchemy
-                    assert isinstance(self.db, SchemaSQLAlchemy)
-                    self.db.drop_schema()
-                else:  # using regular flask sqlalchemy
-                    self.db.drop_all()
-            self._init_db(exclude_schema)
-            self._init_resources()
-            self.db.session.commit()
+            self._init_schema(erase, exclude_schema, template)
         print('done.')
 
+    def _init_schema(self, erase: bool = False, exclude_schema=None, template=None):
+        if erase:
+            if exclude_schema:  # Using then a schema teal sqlalchemy
+                assert isinstance(self.db, SchemaSQLAlchemy)
+                self.db.drop_schema()
+            else:  # using regular flask sqlalchemy
+                self.db.drop_all()
+        self._init_db(exclude_schema)
+        if template:
+            assert isinstance(self.db, SchemaSQLAlchemy)
+            self.db.clone_schema(template)
+        else:
+            self._init_resources()
+        self.db.session.commit()
+
+    def _init_tenants(self, tenants: Iterable[str], jobs: int, erase: bool = False,
+                      exclude_schema=None, template=None):
+        """Initializes the schemas of ``tenants`` over a pool of
+        ``jobs`` threads, each one with its app context.
+        """
+        assert isinstance(self.db, SchemaSQLAlchemy)
+        # Modify the shared metadata before threads use it
+        self.db.index_ltree_columns()
+
+        def init_tenant(tenant: str):
+            with self.app_context(), self.db.tenant(tenant):
+                self._init_schema(erase, exclude_schema, template)
+            return tenant
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for future in as_completed([executor.submit(init_tenant, t) for t in tenants]):
+                print('Initialized {}.'.format(future.result()))
+
     def _init_db(self, exclude_schema=None) -> bool:
         """Where the database is initialized. You can override this.
 
@@ -236,7 +309,41 @@ class Teal(Flask):
             resource.init_db(self.db, **kw)
 
     def apidocs(self):
-        """Apidocs configuration and generation."""
+        """Apidocs configuration.
+
+        See :meth:`.build_apidocs`.
+        """
+        self.add_url_rule('/apidocs', view_func=self.apidocs_endpoint)
+        self.cli.command('apidocs', context_settings=self.cli_context_settings)(
+            self.generate_apidocs
+        )
+        self.build_apidocs()
+
+    def build_apidocs(self):
+        """
+        Encodes the specification that ``/apidocs`` serves, so
+        requests do not generate nor compress it.
+
+        If ``API_DOC_FILE`` is set, this reads that specification
+        and apispec is not even loaded. Otherwise the specification
+        is generated, when the app starts. Apps adding endpoints
+        after starting call this again to document them.
+        """
+        path = self.config.get('API_DOC_FILE')
+        if path:
+            with open(path, 'rb') as f:
+                data = f.read()
+        else:
+            data = json.dumps(self.apidocs_spec()).encode()
+        self._apidocs = self._encode_apidocs(data)  # type: Tuple[bytes, bytes, str]
+
+    def apidocs_spec(self) -> dict:
+        """Generates the OpenApi 2.0 specification."""
+        # Only load apispec when generating the spec
+        from apispec import APISpec
+        from apispec.ext.marshmallow import MarshmallowPlugin
+        from apispec_webframeworks.flask import FlaskPlugin
+
         self.spec = APISpec(
             openapi_version='2.0',
             plugins=[FlaskPlugin(), MarshmallowPlugin()],
@@ -245,19 +352,45 @@ class Teal(Flask):
         for name, resource in self.resources.items():
             if resource.SCHEMA:
                 self.spec.components.schema(name,
-                                     schema=resource.SCHEMA,
-                                     extra_fields=self.config.get_namespace('API_DOC_CLASS_'))
-        self.add_url_rule('/apidocs', view_func=self.apidocs_endpoint)
-
-    def apidocs_endpoint(self):
-        """An endpoint that prints a JSON OpenApi 2.0 specification."""
-        if not getattr(self, '_apidocs', None):
-            # We are forced to to this under a request context
+                                            schema=resource.SCHEMA,
+                                            extra_fields=self.config.get_namespace(
+                                                'API_DOC_CLASS_'))
+        # We are forced to to this under a request context
+        with self.test_request_context():
             for path, view_func in self.view_functions.items():
                 if path != 'static':
                     self.spec.path(view=view_func)
-            self._apidocs = self.spec.to_dict()
-        return jsonify(self._apidocs)
+        return self.spec.to_dict()
+
+    @option('--output', '-o',
+            type=File('w'),
+            default='-',
+            help='The file to write the specification to. By default stdout.')
+    def generate_apidocs(self, output):
+        """Generates the OpenApi specification of the API.
+
+        Set the file in the API_DOC_FILE config so the app
+        serves it instead of generating it.
+        """
+        json.dump(self.apidocs_spec(), output)
+
+    def apidocs_endpoint(self):
+        """An endpoint that prints a JSON OpenApi 2.0 specification."""
+        data, gzipped, etag = self._apidocs
+        if request.accept_encodings.best_match(('gzip',)):
+            response = Response(gzipped, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(etag + '-gzip')
+        else:
+            response = Response(data, mimetype='application/json')
+            response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response.make_conditional(request)
+
+    @staticmethod
+    def _encode_apidocs(data: bytes) -> Tuple[bytes, bytes, str]:
+        """The specification as is and gzipped, and its ETag."""
+        return data, gzip.compress(data), hashlib.sha1(data).hexdigest()
 
 
 class DumpeableHTTPException(ereuse_utils.Dumpeable):
@@ -0,0 +1,156 @@
+import json
+import logging
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+
+from flask import Flask, Response, request
+
+log = logging.getLogger(__name__)
+
+_timer = ContextVar('teal_timer', default=None)  # type: ContextVar[Optional[Timer]]
+
+
+class Timer:
+    """
+    The time a request spends in each phase.
+
+    Phases can overlap: the SQL lazily executed when dumping
+    a model counts both in ``sql`` and ``dump``. A phase that
+    is entered again while running, like the load of a nested
+    schema, counts once.
+    """
+    PHASES = 'sql', 'load', 'dump', 'encode'
+
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        self.durations = dict.fromkeys(self.PHASES, 0.0)  # type: Dict[str, float]
+        self.running = set()
+        self.statements = 0
+        self.rows = 0
+
+    def phase(self, name: str) -> '_Phase':
+        return _Phase(self, name)
+
+    def as_dict(self) -> dict:
+        """The durations, in milliseconds, and the SQL counts."""
+        d = {name: round(duration * 1000, 3) for name, duration in self.durations.items()}
+        d['total'] = round((perf_counter() - self.start) * 1000, 3)
+        d['statements'] = self.statements
+        d['rows'] = self.rows
+        return d
+
+    def header(self) -> str:
+        """The value of the ``Server-Timing`` header."""
+        d = self.as_dict()
+        metrics = ['{};dur={}'.format(name, d[name]) for name in self.PHASES + ('total',)]
+        metrics[0] += ';desc="{} statements / {} rows"'.format(self.statements, self.rows)
+        return ', '.join(metrics)
+
+
+class _Phase:
+    def __init__(self, timer: Timer, name: str) -> None:
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.running.add(self.name)
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.durations[self.name] += perf_counter() - self.start
+        self.timer.running.discard(self.name)
+
+
+class _NoPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def measure(name: str):
+    """
+    A context manager timing a phase of the current request::
+
+        with measure('dump'):
+            ...
+
+    This does nothing if the request is not timed, or
+    if the phase is already being timed.
+    """
+    timer = _timer.get()
+    if timer is None or name in timer.running:
+        return _NO_PHASE
+    return timer.phase(name)
+
+
+class Timing:
+    """
+    Times the phases of the requests of an app, reporting them
+    in the ``Server-Timing`` header of the responses, so they
+    show in the network tab of browsers::
+
+        Server-Timing: sql;dur=12.1;desc="4 statements / 20 rows",
+                       load;dur=0.0, dump;dur=8.3, encode;dur=1.2,
+                       total;dur=25.6
+
+    The phases are the SQL statements, loading and dumping
+    schemas, and encoding the response (JSON, or the formats of
+    :mod:`teal.formats`). Durations are milliseconds; ``total``
+    is from the start of the request until its response is ready,
+    so it does not include streaming the response.
+
+    Rows are the ones the database driver reports; some drivers,
+    like SQLite's, do not report the rows of ``SELECT``.
+
+    :class:`teal.teal.Teal` sets this through ``SERVER_TIMING``,
+    and logs the timings as JSON to the ``teal.timing`` logger
+    with ``SERVER_TIMING_LOG``. Apps without ``SERVER_TIMING``
+    do not time anything.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        self.log = app.config.get('SERVER_TIMING_LOG', False)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.statement_observers.append(self.observe_statement)
+
+    ENVIRON_KEY = 'teal.timing'
+
+    def before_request(self):
+        # Requests inside requests, like the ones of a batch,
+        # restore the timer of the outer request on teardown
+        request.environ[self.ENVIRON_KEY] = _timer.set(Timer())
+
+    def after_request(self, response: Response) -> Response:
+        timer = _timer.get()
+        if timer is not None:
+            response.headers['Server-Timing'] = timer.header()
+            if self.log:
+                log.info(json.dumps(dict(timer.as_dict(),
+                                         method=request.method,
+                                         path=request.path,
+                                         resource=request.blueprint,
+                                         status=response.status_code)))
+        return response
+
+    def teardown_request(self, exc=None):
+        token = request.environ.pop(self.ENVIRON_KEY, None)
+        try:
+            _timer.reset(token)
+        except (TypeError, ValueError):  # No token or from another context
+            _timer.set(None)
+
+    @staticmethod
+    def observe_statement(statement: str, parameters, duration: float, rows: int):
+        timer = _timer.get()
+        if timer is not None:
+            timer.durations['sql'] += duration
+            timer.statements += 1
+            timer.rows += rows
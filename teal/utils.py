@@ -1,10 +1,17 @@
+import importlib
 import inspect
-from typing import Dict, Iterator, Tuple
+from types import ModuleType
+from typing import Dict, Iterator, Tuple, Type, Union
 
 from sqlalchemy.dialects import postgresql
 
 from teal import resource
 
+try:
+    from importlib import metadata
+except ImportError:  # Python < 3.8
+    import importlib_metadata as metadata
+
 
 def compiled(Model, query) -> Tuple[str, Dict[str, str]]:
     """
@@ -16,16 +23,54 @@ def compiled(Model, query) -> Tuple[str, Dict[str, str]]:
     return str(c), c.params
 
 
-def import_resource(module) -> Iterator['resource.Resource']:
+def import_resource(module: Union[ModuleType, str]) -> Iterator['resource.Resource']:
     """
     Gets the resource classes from the passed-in module.
 
     This method yields subclasses of :class:`teal.resource.Resource`
-    found in the given module.
+    found in the given module, which can be its import name,
+    like ``myproject.devices``.
     """
-
+    if isinstance(module, str):
+        module = importlib.import_module(module)
     for obj in vars(module).values():
         if inspect.isclass(obj) \
                 and issubclass(obj, resource.Resource) \
                 and obj != resource.Resource:
             yield obj
+
+
+def entry_point_resources(group='teal.resources') -> Iterator[Type['resource.Resource']]:
+    """
+    Gets the resource classes that the installed packages declare
+    in their entry points, so apps can have plugins::
+
+        setup(...,
+              entry_points={'teal.resources': ['devices = myproject.devices',
+                                               'user = myproject.users:UserDef']})
+
+    An entry point references a module, yielding all its resources
+    (see :func:`.import_resource`), or a resource. Only the modules
+    of the entry points are imported, and each resource is yielded
+    once, even if several entry points reference it.
+
+    Set the group in ``RESOURCE_ENTRY_POINTS`` to have
+    :class:`teal.teal.Teal` load these resources.
+    """
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=group)
+    else:
+        entry_points = entry_points.get(group, ())
+    seen = set()
+    for entry_point in entry_points:
+        obj = entry_point.load()
+        if inspect.ismodule(obj):
+            resources = import_resource(obj)
+        else:
+            assert issubclass(obj, resource.Resource), '{} is not a Resource'.format(obj)
+            resources = obj,
+        for resource_def in resources:
+            if resource_def not in seen:
+                seen.add(resource_def)
+                yield resource_def
@@ -7,7 +7,7 @@ from marshmallow.validate import Range
 
 from teal.client import Client
 from teal.config import Config
-from teal.db import INHERIT_COND, Model, POLYMORPHIC_ID, POLYMORPHIC_ON, SQLAlchemy
+from teal.db import INHERIT_COND, Model, POLYMORPHIC_ID, POLYMORPHIC_ON, SQLAlchemy, Versioned
 from teal.marshmallow import NestedOn
 from teal.resource import Converters, Resource, Schema, View
 from teal.teal import Teal
@@ -121,6 +121,38 @@ def f_config(config: Config, db: SQLAlchemy) -> Config:
     return config
 
 
+@pytest.fixture()
+def fooconfig(config: Config, db: SQLAlchemy) -> Config:
+    """
+    Creates a ``Foo`` resource with a versioned model that has
+    a unique integer ``bar``, and a view without methods, so
+    tests set the ones they need::
+
+        FooDef, = fooconfig.RESOURCE_DEFINITIONS
+        FooDef.VIEW.one = one
+    """
+
+    class Foo(Versioned, db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        bar = db.Column(db.Integer, unique=True)
+
+    class FooView(View):
+        pass
+
+    class FooSchema(Schema):
+        id = Integer()
+        bar = Integer()
+
+    class FooDef(Resource):
+        SCHEMA = FooSchema
+        VIEW = FooView
+        MODEL = Foo
+        ID_CONVERTER = Converters.int
+
+    config.RESOURCE_DEFINITIONS = FooDef,
+    return config
+
+
 @pytest.fixture()
 def app(fconfig: Config, db: SQLAlchemy) -> Teal:
     app = Teal(config=fconfig, db=db)
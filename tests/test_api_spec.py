@@ -1,4 +1,11 @@
+import gzip
+
+from flask import json
+from flask_sqlalchemy import SQLAlchemy
+
 from teal.client import Client
+from teal.config import Config
+from teal.teal import Teal
 
 
 def test_apispec(client: Client):
@@ -14,3 +21,26 @@ def test_apispec(client: Client):
         '/devices/',
         '/apidocs'
     }
+
+
+def test_apispec_file(fconfig: Config, db: SQLAlchemy, tmpdir):
+    """Tests generating the spec into a file and serving it,
+    gzipped and with ETags."""
+    app = Teal(config=fconfig, db=db)
+    path = str(tmpdir.join('apidocs.json'))
+    r = app.test_cli_runner().invoke('apidocs', '--output', path)
+    assert r.exit_code == 0, r.output
+    with open(path) as f:
+        spec = json.load(f)
+    assert 'Device' in spec['definitions']
+
+    fconfig.API_DOC_FILE = path
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    api, r = client.get('/apidocs')
+    assert api == spec
+    assert app.spec is None, 'The app has not generated the spec'
+    client.get('/apidocs', headers={'If-None-Match': r.headers['ETag']}, status=304)
+    data, r = client.get('/apidocs', headers={'Accept-Encoding': 'gzip'}, accept='*/*')
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(data)) == spec
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+
+from flask import Response, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+
+from teal.asgi import ASGIApp
+from teal.auth import TokenAuth
+from teal.config import Config
+from teal.resource import View
+from teal.teal import Teal
+
+
+def call(asgi: ASGIApp, scope: dict, messages: list) -> list:
+    """Calls the ASGI app with the messages from the client,
+    returning the messages the app sent."""
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.get_event_loop().create_future()  # The client stays
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi(scope, receive, send))
+    return sent
+
+
+def http(path: str, method='GET', query=b'', headers=()) -> dict:
+    return {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path,
+            'query_string': query, 'headers': list(headers)}
+
+
+def test_asgi(fconfig: Config, db: SQLAlchemy):
+    """Tests serving through ASGI regular and streamed responses,
+    request bodies and async authentication."""
+    DeviceDef, ComponentDef, ComputerDef = fconfig.RESOURCE_DEFINITIONS
+    ComputerDef.AUTH = True
+
+    def find(self: View, args: dict):
+        if self.resource_def.type == 'Component':
+            return Response(('{}\n'.format(i) for i in range(3)), mimetype='text/plain')
+        return jsonify(args)
+
+    def post(self: View):
+        return jsonify(self.resource_def.schema.load(request.get_json(validate=False))), 201
+
+    class AsyncAuth(TokenAuth):
+        async def authenticate(self, token: str, *args, **kw):
+            return token
+
+    DeviceDef.VIEW.find = find
+    DeviceDef.VIEW.post = post
+    app = Teal(config=fconfig, db=db, Auth=AsyncAuth)
+    asgi = ASGIApp(app)
+
+    assert call(asgi, {'type': 'lifespan'}, [{'type': 'lifespan.startup'},
+                                              {'type': 'lifespan.shutdown'}]) == [
+        {'type': 'lifespan.startup.complete'},
+        {'type': 'lifespan.shutdown.complete'}
+    ]
+
+    asgi = ASGIApp(app)
+    start, body, end = call(asgi, http('/devices/'), [{'type': 'http.request'}])
+    assert start['status'] == 200
+    assert (b'content-type', b'application/json') in start['headers']
+    assert json.loads(body['body']) == {}
+    assert end == {'type': 'http.response.body'}
+
+    # A body in many messages
+    sent = call(asgi, http('/devices/', 'POST', headers=[(b'content-type', b'application/json')]),
+                [{'type': 'http.request', 'body': b'{"model": ', 'more_body': True},
+                 {'type': 'http.request', 'body': b'"foo"}'}])
+    assert sent[0]['status'] == 201
+    assert json.loads(sent[1]['body']) == {'model': 'foo'}
+
+    # Streamed responses
+    start, *chunks, end = call(asgi, http('/components/'), [{'type': 'http.request'}])
+    assert start['status'] == 200
+    assert [c['body'] for c in chunks] == [b'0\n', b'1\n', b'2\n']
+
+    # Async auth
+    sent = call(asgi, http('/computers/'), [{'type': 'http.request'}])
+    assert sent[0]['status'] == 401
+    sent = call(asgi, http('/computers/', headers=[(b'authorization', b'Basic Zm9vOg==')]),
+                [{'type': 'http.request'}])
+    assert sent[0]['status'] == 200
+
+
+def test_asgi_disconnect(fconfig: Config, db: SQLAlchemy):
+    """Tests that clients disconnecting stop the generation
+    of their streamed responses."""
+    app = Teal(config=fconfig, db=db)
+    stopped = threading.Event()
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            try:
+                while True:
+                    yield 'foo\n'
+            finally:
+                stopped.set()
+
+        return Response(generate(), mimetype='text/plain')
+
+    asgi = ASGIApp(app)
+    call(asgi, http('/stream'), [{'type': 'http.request'}, {'type': 'http.disconnect'}])
+    assert stopped.wait(5)
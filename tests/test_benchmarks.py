@@ -0,0 +1,24 @@
+from benchmarks.suite import BENCHMARKS, Bench, compare
+
+
+def test_benchmarks():
+    """Tests that the benchmarks run, so they do not rot."""
+    bench = Bench(computers=2, components=2)
+    for name, benchmark in BENCHMARKS.items():
+        with benchmark(bench) as f:
+            f()
+    computers = bench.computer_dicts()
+    assert len(computers) == 2 and len(computers[0]['components']) == 2
+    assert computers == Bench(computers=2, components=2).computer_dicts(), 'Same data'
+
+
+def test_benchmarks_compare():
+    baseline = {'a': {'median': 1.0}, 'b': {'median': 1.0}, 'c': {'median': 1.0}}
+    results = {'a': {'median': 1.1}, 'b': {'median': 1.5}, 'c': {'median': 0.5},
+               'd': {'median': 1.0}}
+    assert compare(results, baseline, 0.2) == [
+        ('a', 1.0, 1.1, 'same'),
+        ('b', 1.0, 1.5, 'slower'),
+        ('c', 1.0, 0.5, 'faster'),
+        ('d', None, 1.0, 'new')
+    ]
@@ -1,18 +1,27 @@
 import enum
 import ipaddress
 import json
+import os
 from distutils.version import StrictVersion
+from unittest.mock import MagicMock
 
 import pytest
 from boltons import urlutils
-from flask import jsonify
+from flask import Response, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import StatementError
+from sqlalchemy import Enum, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError, StatementError
+from sqlalchemy_utils import LtreeType
 from werkzeug.exceptions import NotFound
 
-from teal.db import DBError, IP, IntEnum, StrictVersionType, URL, UniqueViolation
+from teal.cache import LRUCache
+from teal.config import Config
+from teal.db import ArrayOfEnum, DBError, IP, IntEnum, SchemaSQLAlchemy, StrictVersionType, \
+    PKCache, URL, UniqueViolation, move_subtree, parse_array
 from teal.teal import Teal
 from tests import conftest
+from tests.conftest import f_config
 
 
 def test_not_found(app: Teal):
@@ -45,6 +54,73 @@ def test_db_psql_schemas(db: SQLAlchemy):
     # todo do this
 
 
+def test_db_tenants(config: Config):
+    """Tests initializing the schemas of several tenants."""
+    db = SchemaSQLAlchemy()
+    app = Teal(config=f_config(config, db), db=db, schema='main')
+    schemas = set()
+
+    def init_schema(*args):
+        schemas.add(db.current_schema())
+
+    app._init_schema = MagicMock(side_effect=init_schema)
+    with app.app_context():
+        assert db.current_schema() == 'main'
+        with db.tenant('foo'):
+            assert db.current_schema() == 'foo'
+        assert db.current_schema() == 'main'
+        app.init_db(tenants=('foo', 'bar', 'baz'), jobs=2)
+    assert schemas == {'foo', 'bar', 'baz'}
+    app._init_schema.assert_called_with(False, None, None)
+
+
+@pytest.mark.skipif(not os.environ.get('TEAL_TEST_POSTGRES'),
+                    reason='Set TEAL_TEST_POSTGRES to the URL of a PostgreSQL database.')
+def test_db_tenants_postgres(config: Config):
+    """Tests initializing tenants from a template in a real
+    database, concurrently, each one in its schema."""
+    config.SQLALCHEMY_DATABASE_URI = os.environ['TEAL_TEST_POSTGRES']
+    db = SchemaSQLAlchemy()
+    DeviceDef, ComponentDef, ComputerDef = f_config(config, db).RESOURCE_DEFINITIONS
+    Computer = ComputerDef.MODEL
+
+    def init_db(self, db: SchemaSQLAlchemy, exclude_schema=None):
+        db.session.add(Computer(model='template'))
+
+    ComputerDef.init_db = init_db
+    app = Teal(config=config, db=db, schema='template')
+    schemas = 'template', 'foo', 'bar', 'baz'
+
+    def drop_schemas():
+        with app.app_context(), db.engine.begin() as conn:
+            for schema in schemas:
+                conn.execute('DROP SCHEMA IF EXISTS {} CASCADE'.format(schema))
+
+    drop_schemas()
+    try:
+        runner = app.test_cli_runner()
+        r = runner.invoke('init-db')
+        assert r.exit_code == 0, r.output
+        ComputerDef.init_db = MagicMock(side_effect=AssertionError('Copy the template instead'))
+        r = runner.invoke('init-db', '-t', 'foo', '-t', 'bar', '-t', 'baz',
+                          '--jobs', 2, '--template', 'template')
+        assert r.exit_code == 0, r.output
+        for tenant in 'foo', 'bar', 'baz':
+            with app.app_context(), db.tenant(tenant):
+                assert db.session.execute('SHOW search_path').scalar() == \
+                    '{}, public'.format(tenant)
+                assert [c.model for c in Computer.query] == ['template']
+                # The sequences are past the copied ids
+                computer = Computer(model=tenant)
+                db.session.add(computer)
+                db.session.commit()
+                assert computer.id == 2
+        with app.app_context():
+            assert [c.model for c in Computer.query] == ['template']
+    finally:
+        drop_schemas()
+
+
 @pytest.mark.usefixtures(conftest.app_context.__name__)
 def test_db_strict_version_type(db: SQLAlchemy):
     class Foo(db.Model):
@@ -136,5 +212,245 @@ def test_db_error_unique_violation(db: SQLAlchemy):
     db.session.commit()
     foo_again = Foo(id=2, unique=1)
     db.session.add(foo_again)
-    with pytest.raises(UniqueViolation):
+    with pytest.raises(UniqueViolation) as e:
+        db.session.commit()
+    assert e.value.constraint == e.value.field_name == 'unique'
+    assert 'INSERT' not in e.value.description
+
+
+def test_db_error_sqlstate():
+    """Tests mapping errors through the SQLSTATE and diagnostics of
+    psycopg2 errors, truncating the parameters."""
+
+    class PsycopgError(Exception):
+        pgcode = DBError.UNIQUE_VIOLATION
+        diag = MagicMock(constraint_name='foo_email_key',
+                         message_detail='Key (email)=(a@b.c) already exists.')
+
+    params = [{'email': 'x' * 1000, 'id': i} for i in range(10000)]
+    origin = IntegrityError('INSERT INTO foo...', params, PsycopgError('duplicate key'))
+    e = DBError(origin)
+    assert isinstance(e, UniqueViolation)
+    assert e.constraint == 'foo_email_key'
+    assert e.field_name == 'email'
+    assert e.field_value == 'a@b.c'
+    assert e.description.startswith('duplicate key [parameters: [{')
+    assert len(e.description) < 500
+
+    PsycopgError.pgcode = '23503'  # foreign_key_violation
+    assert DBError(origin).__class__ == DBError
+
+
+def test_db_replica(fconfig: Config, db: SQLAlchemy):
+    """Tests reading from replicas in GET requests."""
+    fconfig.SQLALCHEMY_BINDS = {'replica': 'sqlite:///:memory:'}
+    fconfig.SQLALCHEMY_REPLICAS = 'replica',
+    DeviceDef, *_ = fconfig.RESOURCE_DEFINITIONS
+    Device = DeviceDef.MODEL
+
+    def post():
+        db.session.add(Device(id=2, model='new'))
+        db.session.commit()
+        return Response(status=201)
+
+    DeviceDef.VIEW.post = MagicMock(side_effect=post)
+    app = Teal(config=fconfig, db=db)
+    with app.app_context():
+        app.init_db()
+        db.session.add(Device(id=1, model='primary'))
+        db.session.commit()
+        replica = db.get_engine(app, 'replica')
+        db.Model.metadata.create_all(bind=replica)
+        replica.execute(Device.__table__.insert(), id=1, model='replica', type='Device')
+
+    with app.test_request_context(method='GET'):
+        assert Device.query.one().model == 'replica'
+        # Once we write, we read from the primary
+        db.session.add(Device(id=3, model='foo'))
+        db.session.flush()
+        assert Device.query.filter_by(id=1).one().model == 'primary'
+    with app.test_request_context(method='POST'):
+        assert Device.query.one().model == 'primary'
+    with app.test_request_context(method='GET', headers={'Cookie': 'teal_primary=1'}):
+        assert Device.query.one().model == 'primary'
+
+    _, r = app.test_client().post(res='Device', data={})
+    assert 'teal_primary=1' in r.headers['Set-Cookie']
+
+    # Replicas whose lag cannot be checked are not used
+    app.config['SQLALCHEMY_REPLICA_MAX_LAG'] = 1
+    with app.test_request_context(method='GET'):
+        assert Device.query.filter_by(id=1).one().model == 'primary'
+
+
+def test_db_memoized_result():
+    """Tests caching the values converted from the database."""
+    version = StrictVersionType(cache_size=10)
+    x = version.process_result_value('1.0.0a1', None)
+    y = version.process_result_value('1.0.0a1', None)
+    assert x == y == StrictVersion('1.0.0a1')
+    # Versions are mutable so we get copies
+    assert x is not y
+    assert version._convert.cache_info().hits == 1
+    assert version.process_result_value(None, None) is None
+
+    ip = IP(cache_size=10)
+    x = ip.process_result_value('192.168.1.1', None)
+    # IPs are immutable so we get the same object
+    assert x is ip.process_result_value('192.168.1.1', None)
+
+    # By default there is no cache
+    assert not hasattr(URL()._convert, 'cache_info')
+
+
+def test_db_parse_array():
+    assert parse_array('{}') == []
+    assert parse_array('{a,b,NULL}') == ['a', 'b', None]
+    assert parse_array('{"a,b","c \\"d\\" \\\\",e,"NULL"}') == ['a,b', 'c "d" \\', 'e', 'NULL']
+    assert parse_array('[0:1]={a,b}') == ['a', 'b']
+    for malformed in '', 'a,b', '{"a}', '{"a\\"}', '{"a"b}', '[0:1]':
+        with pytest.raises(ValueError):
+            parse_array(malformed)
+
+
+def test_db_array_of_enum():
+    # We cannot actually try this on the db as we use sqlite for testing
+    class FooEnum(enum.Enum):
+        foo = 'foo'
+        bar = 'bar'
+
+    process = ArrayOfEnum(Enum(FooEnum)).result_processor(postgresql.dialect(), None)
+    assert process('{foo,bar}') == [FooEnum.foo, FooEnum.bar]
+    assert process('{foo,NULL}') == [FooEnum.foo, None]
+    # Drivers returning native arrays
+    assert process(['bar']) == [FooEnum.bar]
+    assert process(None) is None
+
+
+def test_db_ltree(db: SQLAlchemy):
+    """Tests the GiST index and moving subtrees of ltree columns."""
+
+    class Lot(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        path = db.Column(LtreeType)
+
+    # We cannot actually create the table as we use sqlite for testing
+    # but create_all() executes this
+    db.index_ltree_columns()
+    index, = Lot.__table__.indexes
+    assert index.name == 'lot_path_gist'
+    assert index.kwargs['postgresql_using'] == 'gist'
+    # Indexing again does not add more indexes
+    db.index_ltree_columns()
+    assert len(Lot.__table__.indexes) == 1
+
+    s = str(move_subtree(Lot.path, 'a.b', 'c').compile(dialect=postgresql.dialect()))
+    assert s == 'UPDATE lot SET path=(CAST(%(param_1)s AS LTREE) || subpath(lot.path, ' \
+                '%(subpath_1)s)) WHERE lot.path <@ %(path_1)s'
+    s = str(move_subtree(Lot.path, 'a.b').compile(dialect=postgresql.dialect()))
+    assert s == 'UPDATE lot SET path=subpath(lot.path, %(subpath_1)s) WHERE lot.path <@ %(path_1)s'
+
+
+def test_db_pk_cache(app: Teal, db: SQLAlchemy):
+    """Tests caching models by primary key in Query.one()."""
+    Device = app.resources['Device'].MODEL
+    Computer = app.resources['Computer'].MODEL
+    Component = app.resources['Component'].MODEL
+    Device.PK_CACHE = PKCache(LRUCache(), negative_ttl=60)
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args))
+        db.session.add(Computer(id=1, model='foo'))
+        db.session.commit()
+
+    def one(model, id):
+        with app.app_context():
+            statements.clear()
+            result = model.query.filter_by(id=id).one()
+            return result, result.model, len(statements)
+
+    pc, model, queries = one(Device, 1)
+    assert isinstance(pc, Computer) and model == 'foo' and queries == 1
+    # Subclasses share the cache
+    pc, model, queries = one(Computer, 1)
+    assert isinstance(pc, Computer) and model == 'foo' and queries == 0
+    # Components are not computers
+    with pytest.raises(NotFound):
+        one(Component, 1)
+    assert len(statements) == 1
+    # And now we remember it
+    with pytest.raises(NotFound):
+        one(Component, 1)
+    assert len(statements) == 0
+    # Queries that do not filter only by primary key are not cached
+    with app.app_context():
+        statements.clear()
+        Device.query.filter_by(id=1, model='foo').one()
+        assert len(statements) == 1
+
+    # Writing invalidates the cache
+    with app.app_context():
+        Computer.query.filter_by(id=1).one().model = 'bar'
+        db.session.commit()
+    _, model, queries = one(Device, 1)
+    assert model == 'bar' and queries == 1
+    with app.app_context():
+        db.session.add(Component(id=2))
+        db.session.commit()
+        db.session.delete(Computer.query.filter_by(id=1).one())
         db.session.commit()
+    with pytest.raises(NotFound):
+        one(Device, 1)
+    _, _, queries = one(Device, 2)
+    assert queries == 1
+
+
+def test_db_pk_cache_pending(app: Teal, db: SQLAlchemy):
+    """Tests that the primary key cache does not hide the
+    models added to the session, flushed or not."""
+    Device = app.resources['Device'].MODEL
+    Device.PK_CACHE = PKCache(LRUCache(), negative_ttl=60)
+    with app.app_context():
+        with pytest.raises(NotFound):
+            Device.query.filter_by(id=5).one()
+        db.session.add(Device(id=5, model='foo'))
+        assert Device.query.filter_by(id=5).one().model == 'foo'
+        db.session.rollback()
+        # Flushing invalidates the new models
+        with pytest.raises(NotFound):
+            Device.query.filter_by(id=5).one()
+        with db.session.no_autoflush:
+            db.session.add(Device(id=5, model='bar'))
+            db.session.flush()
+            assert Device.query.filter_by(id=5).one().model == 'bar'
+        db.session.commit()
+    with app.app_context():
+        assert Device.query.filter_by(id=5).one().model == 'bar'
+
+
+def test_db_pk_cache_rollback(app: Teal, db: SQLAlchemy):
+    """Tests that the primary key cache forgets the writes
+    that are rolled back."""
+    Device = app.resources['Device'].MODEL
+    Device.PK_CACHE = PKCache(LRUCache(), negative_ttl=60)
+    # An insert
+    with app.app_context():
+        db.session.add(Device(id=5, model='foo'))
+        db.session.flush()
+        assert Device.query.filter_by(id=5).one().model == 'foo'
+        db.session.rollback()
+    with app.app_context():
+        assert Device.query.count() == 0
+        with pytest.raises(NotFound):
+            Device.query.filter_by(id=5).one()
+        db.session.add(Device(id=6, model='bar'))
+        db.session.commit()
+    # A delete
+    with app.app_context():
+        db.session.delete(Device.query.filter_by(id=6).one())
+        db.session.flush()
+        with pytest.raises(NotFound):
+            Device.query.filter_by(id=6).one()
+        db.session.rollback()
+    with app.app_context():
+        assert Device.query.filter_by(id=6).one().model == 'bar'
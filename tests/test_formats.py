@@ -0,0 +1,71 @@
+import datetime
+import uuid
+from enum import Enum
+
+import pytest
+from flask import json, request
+from flask.testing import FlaskClient
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.exceptions import BadRequest
+
+from teal.config import Config
+from teal.formats import CBOR, MessagePack
+from teal.resource import View
+from teal.teal import Teal
+
+# Optional dependencies of teal[msgpack] and teal[cbor]
+cbor2 = pytest.importorskip('cbor2')
+msgpack = pytest.importorskip('msgpack')
+
+
+def test_formats_encode_like_json(app: Teal):
+    """Tests that formats encode values as TealJSONEncoder."""
+
+    class Color(Enum):
+        red = 1
+
+    value = {
+        'datetime': datetime.datetime(2020, 1, 2, 3, 4, 5),
+        'uuid': uuid.UUID(int=1),
+        'set': {1},
+        'enum': Color.red,
+        'nested': [{'timedelta': datetime.timedelta(minutes=1)}, None, 1.5, True]
+    }
+    with app.app_context():
+        expected = json.loads(json.dumps(value))
+        assert MessagePack.loads(MessagePack.dumps(value)) == expected
+        assert CBOR.loads(CBOR.dumps(value)) == expected
+
+
+def test_formats_negotiation(fconfig: Config, db: SQLAlchemy):
+    """Tests decoding requests and encoding responses in
+    MessagePack and CBOR."""
+    DeviceDef, *_ = fconfig.RESOURCE_DEFINITIONS
+
+    def post(self: View):
+        device = request.get_json()
+        return self.schema.jsonify(device)
+
+    DeviceDef.VIEW.post = post
+    app = Teal(config=fconfig, db=db)
+    client = FlaskClient(app, app.response_class)  # Sends any kind of body
+    device = {'id': 1, 'model': 'foo'}
+
+    r = client.post('/devices/', data=msgpack.packb(device), content_type='application/msgpack',
+                    headers={'Accept': 'application/cbor'})
+    assert r.status_code == 200
+    assert r.mimetype == 'application/cbor'
+    assert cbor2.loads(r.data) == device
+
+    r = client.post('/devices/', data=cbor2.dumps(device), content_type='application/cbor',
+                    headers={'Accept': 'application/json;q=0.5, application/x-msgpack'})
+    assert r.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(r.data) == device
+    assert 'Accept' in r.headers['Vary']
+
+    r = client.post('/devices/', data=cbor2.dumps(device), content_type='application/cbor',
+                    headers={'Accept': '*/*'})
+    assert r.mimetype == 'application/json'
+
+    r = client.post('/devices/', data=b'\xc1', content_type='application/msgpack')
+    assert r.status_code == BadRequest.code
@@ -0,0 +1,111 @@
+import gc
+import sqlite3
+import time
+from threading import Thread, Timer
+
+from flask import jsonify
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import pool
+from sqlalchemy.dialects.sqlite.pysqlite import SQLiteDialect_pysqlite
+from werkzeug.exceptions import NotFound
+
+from teal.client import Client
+from teal.config import Config
+from teal.db import QueuePool, ResourceNotFound
+from teal.metrics import Counter, Histogram
+from teal.resource import View
+from teal.teal import Teal
+from tests.conftest import populated_db
+
+
+def test_metrics_types():
+    """Tests exposing counters and histograms updated
+    from several threads."""
+    counter = Counter('c', 'A counter.', ('a',))
+    histogram = Histogram('h', 'A histogram.', ('a',), buckets=(1, 5))
+
+    def work():
+        for i in range(1000):
+            counter.inc(('x"',))
+            histogram.observe(('x',), i % 7)
+
+    threads = [Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    del threads, t
+    gc.collect()
+    assert not counter._shards and not histogram._shards, 'Finished threads are folded'
+    assert list(counter.expose()) == [
+        '# HELP c A counter.',
+        '# TYPE c counter',
+        'c{a="x\\""} 4000'
+    ]
+    assert list(histogram.expose())[2:] == [
+        'h_bucket{a="x",le="1"} 1144',
+        'h_bucket{a="x",le="5"} 3432',
+        'h_bucket{a="x",le="+Inf"} 4000',
+        'h_sum{a="x"} 11988',
+        'h_count{a="x"} 4000'
+    ]
+
+
+def test_metrics(fconfig: Config, db: SQLAlchemy, tmpdir, monkeypatch):
+    """Tests the /metrics endpoint."""
+    DeviceDef, *_ = fconfig.RESOURCE_DEFINITIONS
+
+    def find(self: View, args: dict):
+        return jsonify([{'id': 1}])
+
+    def one(self: View, id):
+        raise ResourceNotFound('Device')
+
+    DeviceDef.VIEW.find = find
+    DeviceDef.VIEW.one = one
+    fconfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+    # Make SQLite default to SQLAlchemy's QueuePool, as PostgreSQL does,
+    # so teal.db.SQLAlchemy replaces it with our QueuePool
+    monkeypatch.setattr(SQLiteDialect_pysqlite, 'get_pool_class',
+                        classmethod(lambda cls, url: pool.QueuePool))
+    # A pool size stops Flask-SQLAlchemy from choosing NullPool for SQLite files
+    fconfig.SQLALCHEMY_POOL_SIZE = 5
+    app = Teal(config=fconfig, db=db)
+    assert app.metrics is None
+    app.test_client().get('/metrics', status=NotFound)
+
+    fconfig.METRICS = True
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app):
+        client.get(res='Device')
+        client.get(res='Device')
+        client.get(res='Computer', item=1, status=ResourceNotFound)
+        client.get('/foo', status=NotFound)
+        data, r = client.get('/metrics', accept='*/*')
+        with app.app_context():
+            assert isinstance(db.engine.pool, QueuePool)
+    assert r.mimetype == 'text/plain'
+    lines = data.splitlines()
+    assert '# TYPE teal_request_duration_seconds histogram' in lines
+    assert 'teal_request_duration_seconds_count{resource="Device",method="GET"} 2' in lines
+    assert 'teal_request_duration_seconds_count{resource="Computer",method="GET"} 1' in lines
+    assert 'teal_response_size_bytes_bucket{resource="Device",method="GET",le="100"} 2' in lines
+    assert 'teal_errors_total{resource="Computer",method="GET",exception="ResourceNotFound"} 1' \
+           in lines
+    assert 'teal_errors_total{resource="",method="GET",exception="NotFound"} 1' in lines
+    assert 'teal_db_pool_checked_out{bind="default"} 0' in lines
+    assert 'teal_db_pool_overflow{bind="default"} 0' in lines
+    assert any(line.startswith('teal_db_pool_wait_seconds{bind="default"} ') for line in lines)
+
+
+def test_queue_pool_wait_time():
+    """Tests that the pool only accounts the time waiting for
+    connections returned by other threads."""
+    p = QueuePool(lambda: time.sleep(0.05) or sqlite3.connect(':memory:'),
+                  pool_size=1, max_overflow=0)
+    connection = p.connect()  # Creating it does not count
+    assert p.wait_time < 0.04
+    Timer(0.1, connection.close).start()
+    p.connect().close()
+    assert 0.05 < p.wait_time < 0.5
@@ -1,6 +1,11 @@
+from uuid import UUID
+
 from marshmallow.fields import Integer, Str
+from sqlalchemy_utils import LtreeType
 
-from teal.query import Between, Equal, ILike, Join, Or, Query, Sort, SortField
+from teal.db import SQLAlchemy, UUIDLtree
+from teal.query import AncestorOf, Between, Depth, DescendantOf, Equal, ILike, Join, LQuery, Or, \
+    Query, Sort, SortField
 from teal.teal import Teal
 from teal.utils import compiled
 
@@ -57,3 +62,32 @@ def test_query_sort(app: Teal):
         assert len(sort) == 2
         assert 'device.model ASC' in sort
         assert 'device.id DESC' in sort
+
+
+def test_query_ltree(app: Teal, db: SQLAlchemy):
+    """Tests the query fields for ltree columns."""
+    with app.app_context():
+        class Lot(db.Model):
+            id = db.Column(db.Integer, primary_key=True)
+            path = db.Column(LtreeType)
+
+        class Q(Query):
+            ancestor = AncestorOf(Lot.path)
+            descendant = DescendantOf(Lot.path)
+            lquery = LQuery(Lot.path)
+            depth = Depth(Lot.path)
+
+        uuid = UUID('a8f4a9d2-9a6c-4d7c-9c8e-1c4c7d2a6e1f')
+        query = Q().load({
+            'ancestor': 'a.b',
+            'descendant': str(uuid),
+            'lquery': '*.b.*',
+            'depth': 2
+        })
+        s, params = compiled(Lot, query)
+        # Order between query clauses can change
+        assert 'lot.path @> %(path_' in s
+        assert 'lot.path <@ %(path_' in s
+        assert 'lot.path ~ %(path_' in s
+        assert 'nlevel(lot.path) = %(nlevel_1)s' in s
+        assert set(params.values()) == {'a.b', UUIDLtree.convert(uuid), '*.b.*', 2}
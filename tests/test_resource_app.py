@@ -1,20 +1,28 @@
 """
 Tests resources on the app level
 """
+import io
+import zlib
 from typing import Tuple
 from unittest.mock import MagicMock
 
 import pytest
-from flask import Response, request
+from flask import Response, json, request, url_for
 from flask.json import jsonify
 from flask_sqlalchemy import SQLAlchemy
-from marshmallow.fields import Integer
-from werkzeug.exceptions import MethodNotAllowed, NotFound, UnprocessableEntity
+from marshmallow.fields import Integer, Nested
+from sqlalchemy.exc import OperationalError
+from werkzeug.exceptions import BadRequest, MethodNotAllowed, NotFound, RequestEntityTooLarge, \
+    UnprocessableEntity
 
 from teal.client import Client
+from teal.cache import ResponseCache
 from teal.config import Config
+from teal.db import ResourceNotFound, StaleResource, UniqueViolation
+from teal.json_util import iter_json_array
 from teal.marshmallow import IsType, ValidationError
-from teal.resource import Resource as ResourceDef
+from teal.query import ILike, Query, Sort, SortField
+from teal.resource import Resource as ResourceDef, View
 from teal.teal import Teal
 from tests.conftest import populated_db
 
@@ -34,6 +42,13 @@ def test_init(app: Teal):
     assert app.tree['Component'] in app.tree['Device'].descendants
     assert len(app.tree['Device'].descendants) == 2
     assert app.tree['Computer'].parent == app.tree['Component'].parent == app.tree['Device']
+    assert app.types.descendants['Device'] == {'Device', 'Computer', 'Component'}
+    assert app.types.subtypes['Computer'] == ('Computer',)
+    assert app.types.ancestors['Computer'] == ('Computer', 'Device')
+    assert app.types.is_subtype('Computer', 'Device')
+    assert not app.types.is_subtype('Device', 'Computer')
+    assert app.types.related('Computer') == {'Computer', 'Device'}
+    assert set(app.resources['Device'].subresources_types) == {'Device', 'Computer', 'Component'}
 
     views = {
         'Component.main',
@@ -245,3 +260,518 @@ def test_http_exception(fconfig: Config, db: SQLAlchemy):
     client = Teal(config=fconfig, db=db).test_client()  # type: Client
     d, _ = client.get(res=DeviceDef.type, status=NotFound)
     assert d['code'] == 404
+
+
+def test_export(fconfig: Config, db: SQLAlchemy):
+    """Tests the ``export`` CLI command of the resources."""
+    DeviceDef, ComponentDef, ComputerDef = fconfig.RESOURCE_DEFINITIONS  # type: Tuple[ResourceDef]
+
+    class Filters(Query):
+        model = ILike(DeviceDef.MODEL.model)
+
+    class Sorting(Sort):
+        id = SortField(DeviceDef.MODEL.id)
+
+    class FindArgs(DeviceDef.VIEW.FindArgs):
+        filter = Nested(Filters, missing=[])
+        sort = Nested(Sorting, missing=[])
+
+    DeviceDef.VIEW.FindArgs = FindArgs
+    app = Teal(config=fconfig, db=db)
+    with populated_db(db, app), app.app_context():
+        db.session.add(ComputerDef.MODEL(id=1, model='foo'))
+        db.session.add(ComponentDef.MODEL(id=2, model='foobar'))
+        db.session.add(DeviceDef.MODEL(id=3, model='bar'))
+        db.session.commit()
+    runner = app.test_cli_runner()
+
+    r = runner.invoke('device', 'export', '--batch-size', 2)
+    rows = [json.loads(line) for line in r.output.splitlines()]
+    assert sorted(row['id'] for row in rows) == [1, 2, 3]
+    assert {'id': 1, 'model': 'foo', 'type': 'Computer'} in rows
+
+    r = runner.invoke('device', 'export', '-q', '{"filter": {"model": "foo"}, "sort": {"id": 0}}')
+    assert [json.loads(line)['id'] for line in r.output.splitlines()] == [2, 1]
+
+    r = runner.invoke('device', 'export', '--format', 'csv', '--columns', 'id,model',
+                      '-q', '{"sort": {"id": 1}}')
+    assert r.output.splitlines() == ['id,model', '1,foo', '2,foobar', '3,bar']
+
+
+def test_jsonify_update_fields(app: Teal):
+    """Tests that passing the ignored ``update_fields`` warns."""
+    schema = app.resources['Device'].schema
+    with app.test_request_context(), pytest.deprecated_call():
+        r = schema.jsonify([], many=True, update_fields=False)
+    assert r.get_json() == []
+
+
+def test_optimistic_concurrency(fooconfig: Config, db: SQLAlchemy):
+    """Tests modifying versioned models with If-Match headers."""
+    FooDef, = fooconfig.RESOURCE_DEFINITIONS
+    Foo = FooDef.MODEL
+
+    def patch(self: View, id):
+        foo = Foo.query.filter_by(id=id).one()
+        self.check_if_match(foo)
+        foo.bar = request.get_json()['bar']
+        if foo.bar == 3:
+            # Someone modifies foo in the meantime
+            db.session.execute(Foo.__table__.update().values(version=Foo.version + 1))
+        db.session.commit()
+        response = jsonify({'bar': foo.bar})
+        response.set_etag(foo.etag)
+        return response
+
+    FooDef.VIEW.patch = patch
+    app = Teal(config=fooconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app), app.app_context():
+        db.session.add(Foo(id=1, bar=0))
+        db.session.commit()
+
+    # No If-Match: modify whatever version there is
+    _, r = client.patch({'bar': 1}, res='Foo', item=1)
+    assert r.headers['ETag'] == '"2"'
+    _, r = client.patch({'bar': 2}, res='Foo', item=1, headers={'If-Match': '"2"'})
+    assert r.headers['ETag'] == '"3"'
+    # Our version is old
+    client.patch({'bar': 4}, res='Foo', item=1, headers={'If-Match': '"2"'},
+                 status=StaleResource)
+    # Someone modified it between we read and write
+    client.patch({'bar': 3}, res='Foo', item=1, headers={'If-Match': '"3"'},
+                 status=StaleResource)
+    with app.app_context():
+        assert Foo.query.one().bar == 2
+
+
+def test_async_view(fooconfig: Config, db: SQLAlchemy):
+    """Tests coroutine views awaiting the database."""
+    FooDef, = fooconfig.RESOURCE_DEFINITIONS
+    Foo = FooDef.MODEL
+
+    async def one(self: View, id):
+        foo = await db.run_sync(lambda: Foo.query.filter_by(id=id).one())
+        return jsonify({'bar': foo.bar})
+
+    async def post(self: View):
+        def create(bar):
+            db.session.add(Foo(bar=bar))
+            db.session.commit()
+
+        await db.run_sync(create, request.get_json()['bar'])
+        return Response(status=201)
+
+    FooDef.VIEW.one = one
+    FooDef.VIEW.post = post
+    app = Teal(config=fooconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app):
+        client.post({'bar': 2}, res='Foo', status=201)
+        foo, _ = client.get(res='Foo', item=1)
+        assert foo == {'bar': 2}
+        client.get(res='Foo', item=2, status=ResourceNotFound)
+        # DB errors keep being mapped
+        client.post({'bar': 2}, res='Foo', status=UniqueViolation)
+
+
+def test_etag(fooconfig: Config, db: SQLAlchemy):
+    """Tests ETags and conditional GETs."""
+    FooDef, = fooconfig.RESOURCE_DEFINITIONS
+    Foo = FooDef.MODEL
+    serialized = []
+
+    def serialize(foo):
+        serialized.append(foo)
+        return jsonify({'bar': foo.bar})
+
+    def one(self: View, id):
+        foo = Foo.query.filter_by(id=id).one()
+        if foo.bar:  # hash the body
+            return jsonify({'bar': foo.bar})
+        return self.not_modified(foo.etag) or serialize(foo)
+
+    def find(self: View, args: dict):
+        query = Foo.query
+        return self.not_modified(query.etag(Foo.version), weak=True) \
+               or jsonify([f.bar for f in query])
+
+    FooDef.VIEW.one = one
+    FooDef.VIEW.find = find
+    app = Teal(config=fooconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app), app.app_context():
+        db.session.add(Foo(id=1, bar=0))
+        db.session.add(Foo(id=2, bar=2))
+        db.session.commit()
+
+    _, r = client.get(res='Foo', item=1)
+    assert r.headers['ETag'] == '"1"'
+    _, r = client.get(res='Foo', item=1, headers={'If-None-Match': '"1"'}, status=304)
+    assert r.headers['ETag'] == '"1"'
+    assert len(serialized) == 1, 'The 304 does not serialize the model'
+    client.get(res='Foo', item=1, headers={'If-None-Match': '"0"'})
+    assert len(serialized) == 2
+
+    # Strong ETag of the body
+    _, r = client.get(res='Foo', item=2)
+    etag = r.headers['ETag']
+    _, r = client.get(res='Foo', item=2, headers={'If-None-Match': etag}, status=304)
+    assert not r.data
+
+    # Weak ETag of the collection
+    _, r = client.get(res='Foo')
+    etag = r.headers['ETag']
+    assert etag == 'W/"2-1"'
+    client.get(res='Foo', headers={'If-None-Match': etag}, status=304)
+    with app.app_context():
+        Foo.query.filter_by(id=2).one().bar = 3
+        db.session.commit()
+    _, r = client.get(res='Foo', headers={'If-None-Match': etag})
+    assert r.headers['ETag'] == 'W/"2-2"'
+
+
+def test_response_cache(fconfig: Config, db: SQLAlchemy):
+    """Tests caching responses and invalidating them through
+    the resource tree."""
+    DeviceDef, ComponentDef, ComputerDef = fconfig.RESOURCE_DEFINITIONS
+    DeviceDef.CACHE = ResponseCache(ttl=60)  # Component and Computer inherit it
+    found = []
+
+    def find(self: View, args: dict):
+        found.append(self.resource_def.type)
+        things = self.resource_def.MODEL.query.order_by(self.resource_def.MODEL.id)
+        return self.schema.jsonify(things, many=True)
+
+    DeviceDef.VIEW.find = find
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app):
+        client.get(res='Device')
+        client.get(res='Device', query=[('page', 1)])
+        devices, r = client.get(res='Device')
+        assert devices == []
+        assert found == ['Device', 'Device']
+        # Cached responses keep being conditional
+        client.get(res='Device', headers={'If-None-Match': r.headers['ETag']}, status=304)
+        client.get(res='Device', token='other user')
+        assert found == ['Device', 'Device', 'Device']
+        # Cookies can identify users too
+        client.set_cookie('localhost', 'session', '1')
+        client.get(res='Device')
+        client.get(res='Device')
+        assert found == ['Device', 'Device', 'Device', 'Device', 'Device']
+        client.delete_cookie('localhost', 'session')
+        client.get(res='Component')
+        client.get(res='Computer')
+        found.clear()
+
+        with app.app_context():
+            Component = ComponentDef.MODEL
+            db.session.add(Component(id=1))
+            db.session.commit()
+        # Devices and components are invalidated but computers not
+        devices, _ = client.get(res='Device')
+        assert [d['id'] for d in devices] == [1]
+        client.get(res='Component')
+        client.get(res='Computer')
+        assert found == ['Device', 'Component']
+
+
+def test_compression(fconfig: Config, db: SQLAlchemy):
+    """Tests compressing responses and streamed responses."""
+    DeviceDef, ComponentDef, ComputerDef = fconfig.RESOURCE_DEFINITIONS
+    ComponentDef.COMPRESS = False
+    devices = [{'id': i, 'model': 'foo'} for i in range(100)]
+
+    def find(self: View, args: dict):
+        if self.resource_def.type == 'Computer':
+            return Response((json.dumps(d) + '\n' for d in devices),
+                            mimetype='application/x-ndjson')
+        return jsonify(devices)
+
+    DeviceDef.VIEW.find = find
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    gzip = {'Accept-Encoding': 'br;q=1, gzip;q=0.5'}
+
+    data, r = client.get(res='Device', headers=gzip, accept='*/*')
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.headers['Vary'] == 'Accept-Encoding'
+    assert r.headers['ETag'].startswith('W/')
+    assert int(r.headers['Content-Length']) == len(data)
+    assert json.loads(zlib.decompress(data, 16 + zlib.MAX_WBITS)) == devices
+    # Clients sending the ETag get a 304
+    client.get(res='Device', headers=dict(gzip, **{'If-None-Match': r.headers['ETag']}),
+               accept='*/*', status=304)
+    # Clients not accepting gzip
+    _, r = client.get(res='Device', accept='*/*')
+    assert 'Content-Encoding' not in r.headers
+    _, r = client.get(res='Device', headers={'Accept-Encoding': 'br, gzip;q=0'}, accept='*/*')
+    assert 'Content-Encoding' not in r.headers
+    # Resources not compressing
+    _, r = client.get(res='Component', headers=gzip, accept='*/*')
+    assert 'Content-Encoding' not in r.headers
+    # Streamed responses
+    data, r = client.get(res='Computer', headers=gzip, accept='*/*')
+    assert r.headers['Content-Encoding'] == 'gzip'
+    lines = zlib.decompress(data, 16 + zlib.MAX_WBITS).decode().splitlines()
+    assert [json.loads(line) for line in lines] == devices
+    # Small responses
+    devices = devices[:1]
+    _, r = client.get(res='Device', headers=gzip, accept='*/*')
+    assert 'Content-Encoding' not in r.headers
+
+
+def test_batch(fconfig: Config, db: SQLAlchemy):
+    """Tests executing requests in batches, with and without
+    a transaction."""
+    DeviceDef, ComponentDef, ComputerDef = fconfig.RESOURCE_DEFINITIONS
+
+    def find(self: View, args: dict):
+        return jsonify([d.id for d in DeviceDef.MODEL.query.order_by(DeviceDef.MODEL.id)])
+
+    def post(self: View):
+        db.session.add(DeviceDef.MODEL(**request.get_json()))
+        db.session.commit()
+        return Response(status=201)
+
+    DeviceDef.VIEW.find = find
+    DeviceDef.VIEW.post = post
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    client.post([], uri='/batch', status=NotFound)  # Disabled by default
+    fconfig.BATCH_MAX_REQUESTS = 50
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app):
+        responses, _ = client.post([
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 1}},
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 1}},
+            {'path': '/devices/', 'query': {'foo': 'bar'}}
+        ], uri='/batch', status=200)
+        assert [r['status'] for r in responses] == [201, 400, 200]
+        assert responses[1]['body']['type'] == 'UniqueViolation'
+        assert responses[2]['body'] == [1]
+
+        responses, _ = client.post([
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 2}},
+            {'path': '/devices/'},
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 2}},
+            {'path': '/devices/'}
+        ], uri='/batch', query=[('transaction', 'true')], status=200)
+        assert [r['status'] for r in responses] == [201, 200, 400]
+        assert responses[1]['body'] == [1, 2]
+        devices, _ = client.get(res='Device')
+        assert devices == [1], 'The transaction has been rolled back'
+
+        client.post([
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 2}},
+            {'path': '/devices/'}
+        ], uri='/batch', query=[('transaction', 'true')], status=200)
+        devices, _ = client.get(res='Device')
+        assert devices == [1, 2]
+
+        # Nested batches are rejected however their path is written
+        nested = {'method': 'POST', 'path': '/batch', 'body': [{'path': '/devices/'}]}
+        paths = '/batch', '/batch?x=1', '//batch', '/batch/'
+        responses, _ = client.post([dict(nested, path=path) for path in paths],
+                                   uri='/batch', status=200)
+        assert all(r['status'] >= 300 for r in responses)
+        assert responses[0]['status'] == responses[1]['status'] == 400
+        client.post([{'path': '/devices/'}] * 51, uri='/batch', status=UnprocessableEntity)
+        client.post([{'method': 'FOO', 'path': '/devices/'}], uri='/batch', status=ValidationError)
+
+
+def test_batch_error(fconfig: Config, db: SQLAlchemy):
+    """Tests that requests raising unexpected errors get a 500
+    without losing the responses of the rest of the batch."""
+    DeviceDef, *_ = fconfig.RESOURCE_DEFINITIONS
+
+    def one(self: View, id):
+        return 1 / 0
+
+    def post(self: View):
+        db.session.add(DeviceDef.MODEL(**request.get_json()))
+        db.session.commit()
+        return Response(status=201)
+
+    DeviceDef.VIEW.one = one
+    DeviceDef.VIEW.post = post
+    fconfig.SERVER_TIMING = True
+    fconfig.BATCH_MAX_REQUESTS = 50
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app):
+        responses, r = client.post([
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 1}},
+            {'path': '/devices/1'},
+            {'method': 'POST', 'path': '/devices/', 'body': {'id': 2}}
+        ], uri='/batch', status=200)
+        assert [r['status'] for r in responses] == [201, 500, 201]
+        assert responses[1]['body']['type'] == 'InternalServerError'
+        assert 'Server-Timing' in responses[0]['headers']
+        assert 'Server-Timing' in r.headers, 'The timing of the batch survives its requests'
+        with app.app_context():
+            assert DeviceDef.MODEL.query.count() == 2
+
+
+def test_iter_json(fconfig: Config, db: SQLAlchemy):
+    """Tests parsing big bodies incrementally, with limits."""
+    fconfig.REQUEST_SPOOL_SIZE = 10
+    DeviceDef, ComponentDef, ComputerDef = fconfig.RESOURCE_DEFINITIONS
+    ComponentDef.MAX_ITEMS = 3
+    ComputerDef.MAX_BODY_SIZE = 50
+
+    def post(self: View):
+        batches = [[d['model'] for d in batch] for batch in request.iter_json(batch_size=2)]
+        return jsonify(batches)
+
+    DeviceDef.VIEW.post = post
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    devices = [{'model': str(i)} for i in range(5)]
+
+    batches, _ = client.post(devices, res='Device', status=200)
+    assert batches == [['0', '1'], ['2', '3'], ['4']]
+    ndjson = '\n'.join(json.dumps(d) for d in devices)
+    batches, _ = client.post(ndjson, res='Device', content_type='application/x-ndjson', status=200)
+    assert batches == [['0', '1'], ['2', '3'], ['4']]
+    batches, _ = client.post([], res='Device', status=200)
+    assert batches == []
+
+    client.post('[{"model": "0"}', res='Device', content_type='text/plain', status=BadRequest)
+    client.post([{'model': 0}], res='Device', status=ValidationError)
+    client.post(devices, res='Component', status=RequestEntityTooLarge)
+    client.post(devices[:3], res='Component', status=200)
+    client.post(devices, res='Computer', status=RequestEntityTooLarge)
+
+
+def test_iter_json_array():
+    """Tests parsing JSON arrays in small chunks, and giving up
+    on the items that are too big."""
+    values = [{'a': 'é' * i, 'b': [i, 12345]} for i in range(50)] + [12, 'x' * 500, None]
+    body = json.dumps(values).encode()
+    assert list(iter_json_array(io.BytesIO(body), chunk_size=3)) == values
+    assert list(iter_json_array(io.BytesIO(body), chunk_size=3, max_item_size=600)) == values
+    body = ('[1, "' + 'x' * 1000).encode()
+    items = iter_json_array(io.BytesIO(body), chunk_size=10, max_item_size=100)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match='after 100 characters'):
+        next(items)
+
+
+def test_lazy_startup(fconfig: Config, db: SQLAlchemy):
+    """Tests that resources create their schemas and the URL
+    builders on first use, and the apidocs at startup."""
+    app = Teal(config=fconfig, db=db)
+    device_def = app.resources['Device']
+    assert 'schema' not in device_def.__dict__
+    assert isinstance(device_def.schema, fconfig.RESOURCE_DEFINITIONS[0].SCHEMA)
+    assert device_def.schema is device_def.schema
+    assert app.spec is not None
+    with app.test_request_context():
+        assert url_for('Device.main', id=3) == '/devices/3'
+        assert url_for('Device.main', id=None, foo='bar') == '/devices/?foo=bar'
+    api, _ = app.test_client().get('/apidocs')
+    assert 'Device' in api['definitions']
+
+
+def test_server_timing(fooconfig: Config, db: SQLAlchemy, caplog):
+    """Tests timing the phases of requests in Server-Timing."""
+    FooDef, = fooconfig.RESOURCE_DEFINITIONS
+    Foo = FooDef.MODEL
+
+    def find(self: View, args: dict):
+        return self.resource_def.schema.jsonify(Foo.query.all(), many=True)
+
+    def post(self: View):
+        foo = Foo(**request.get_json())
+        db.session.add(foo)
+        db.session.commit()
+        return self.resource_def.schema.jsonify(foo), 201
+
+    FooDef.VIEW.find = find
+    FooDef.VIEW.post = post
+    app = Teal(config=fooconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app):
+        _, r = client.get(res='Foo')
+        assert 'Server-Timing' not in r.headers, 'Disabled by default'
+        assert not app.statement_observers
+
+    fooconfig.SERVER_TIMING = fooconfig.SERVER_TIMING_LOG = True
+    app = Teal(config=fooconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app), caplog.at_level('INFO', 'teal.timing'):
+        client.post({'id': 1, 'bar': 2}, res='Foo')
+        _, r = client.get(res='Foo')
+        metrics = {m.split(';')[0]: m for m in r.headers['Server-Timing'].split(', ')}
+        assert set(metrics) == {'sql', 'load', 'dump', 'encode', 'total'}
+        assert metrics['sql'].endswith('desc="1 statements / 0 rows"')
+        assert metrics['load'] == 'load;dur=0.0'
+        assert float(metrics['dump'].split('dur=')[1]) > 0
+        logged = json.loads(caplog.records[-1].getMessage())
+        assert logged['path'] == '/foos/'
+        assert logged['resource'] == 'Foo'
+        assert logged['statements'] == 1
+        _, r = client.post({'id': 2, 'bar': 3}, res='Foo')
+        assert 'load;dur=0.0,' not in r.headers['Server-Timing']
+
+
+def test_slow_query_log(fooconfig: Config, db: SQLAlchemy, caplog):
+    """Tests logging slow SQL statements with their endpoint,
+    and its rate limit."""
+    FooDef, = fooconfig.RESOURCE_DEFINITIONS
+    Foo = FooDef.MODEL
+
+    def find(self: View, args: dict):
+        return jsonify([f.bar for f in Foo.query.filter_by(bar='x' * 300)])
+
+    def one(self: View, id):
+        return jsonify(Foo.query.filter_by(id=id).one().bar)
+
+    FooDef.VIEW.find = find
+    FooDef.VIEW.one = one
+    fooconfig.SLOW_QUERY_THRESHOLD = 0
+    fooconfig.SLOW_QUERY_MAX_PER_MINUTE = 2
+    app = Teal(config=fooconfig, db=db)
+    client = app.test_client()  # type: Client
+    with populated_db(db, app), caplog.at_level('WARNING', 'teal.slow_queries'):
+        caplog.clear()
+        client.get(res='Foo')
+        entry = json.loads(caplog.records[-1].getMessage())
+        assert entry['statement'].startswith('SELECT')
+        assert len(entry['parameters']) == 203 and entry['parameters'].endswith('...')
+        assert entry['resource'] == 'Foo'
+        assert entry['endpoint'] == 'Foo.main'
+        assert entry['handler'] == 'find'
+        assert entry['path'] == '/foos/'
+        # Rate limit
+        app.slow_query_log._logged = 2
+        client.get(res='Foo')
+        client.get(res='Foo')
+        assert len(caplog.records) == 1
+        assert app.slow_query_log.dropped == 2
+        app.slow_query_log._minute = None
+        client.get(res='Foo')
+        assert json.loads(caplog.records[-1].getMessage())['dropped'] == 2
+        # Failed statements are logged too
+        app.slow_query_log._minute = None
+        caplog.clear()
+        with app.app_context(), pytest.raises(OperationalError):
+            db.session.execute('SELECT * FROM nonexistent')
+        assert json.loads(caplog.records[-1].getMessage())['statement'] == \
+            'SELECT * FROM nonexistent'
+        # Falsy ids are items
+        app.slow_query_log._minute = None
+        client.get(uri='/foos/0', status=ResourceNotFound)
+        assert json.loads(caplog.records[-1].getMessage())['handler'] == 'one'
+        # Bulk statements only repr some parameters
+        app.slow_query_log._minute = None
+        with app.app_context():
+            db.session.execute(FooDef.MODEL.__table__.insert(),
+                               [{'id': i, 'bar': i, 'version': 1} for i in range(1, 1000)])
+        entry = json.loads(caplog.records[-1].getMessage())
+        assert entry['statement'].startswith('INSERT')
+        assert len(entry['parameters']) <= 203
@@ -51,3 +51,29 @@ def test_regular_error():
         'message': "division by zero",
         'type': 'ZeroDivisionError'
     }
+
+
+def test_client_max_queries(fconfig: Config, db: SchemaSQLAlchemy):
+    """Tests asserting the number of SQL statements of requests."""
+    DeviceDef, *_ = fconfig.RESOURCE_DEFINITIONS
+    Device = DeviceDef.MODEL
+
+    def find(self, args: dict):
+        return self.resource_def.schema.jsonify(Device.query.all(), many=True)
+
+    DeviceDef.VIEW.find = find
+    app = Teal(config=fconfig, db=db)
+    client = app.test_client()  # type: Client
+    with conftest.populated_db(db, app):
+        client.get(res='Device', max_queries=1)
+        with pytest.raises(AssertionError, match='at most 0 SQL statements but there were 1'):
+            client.get(res='Device', max_queries=0)
+        with client.assert_max_queries(2) as statements:
+            client.get(res='Device')
+            client.get(res='Device')
+        assert len(statements) == 2
+        assert statements[0].startswith('SELECT')
+        with pytest.raises(AssertionError, match=r'(?s)there were 3:\nSELECT.*\nSELECT'):
+            with client.assert_max_queries(2):
+                for _ in range(3):
+                    client.get(res='Device')
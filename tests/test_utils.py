@@ -1,5 +1,9 @@
+from flask_sqlalchemy import SQLAlchemy
+
 from teal import utils
+from teal.config import Config
 from teal.resource import Resource
+from teal.teal import Teal
 
 
 def test_import_resource():
@@ -20,3 +24,40 @@ def test_import_resource():
 
     x = set(utils.import_resource(module))
     assert x == {module.Foo, module.Bar}
+
+
+def test_import_resource_by_name():
+    """Tests importing the resources of a module from its name."""
+    from tests import conftest
+    assert set(utils.import_resource('tests.conftest')) == set(utils.import_resource(conftest))
+
+
+def test_entry_point_resources(fconfig: Config, db: SQLAlchemy, tmpdir, monkeypatch):
+    """Tests getting the resources from the entry points
+    of installed packages."""
+    tmpdir.join('fooresources.py').write(
+        'from teal.resource import Resource, Schema\n'
+        'class Foo(Schema):\n'
+        '    pass\n'
+        'class Bar(Schema):\n'
+        '    pass\n'
+        'class FooDef(Resource):\n'
+        '    SCHEMA = Foo\n'
+        'class BarDef(Resource):\n'
+        '    SCHEMA = Bar\n'
+    )
+    dist_info = tmpdir.mkdir('foo-1.0.dist-info')
+    dist_info.join('METADATA').write('Name: foo\nVersion: 1.0\n')
+    dist_info.join('entry_points.txt').write(
+        '[teal.resources]\n'
+        'all = fooresources\n'
+        'foo = fooresources:FooDef\n'
+    )
+    monkeypatch.syspath_prepend(str(tmpdir))
+    resources = list(utils.entry_point_resources())
+    assert sorted(r.__name__ for r in resources) == ['BarDef', 'FooDef']
+    assert list(utils.entry_point_resources('foo')) == []
+
+    fconfig.RESOURCE_ENTRY_POINTS = 'teal.resources'
+    app = Teal(config=fconfig, db=db)
+    assert {'Device', 'Foo', 'Bar'} <= set(app.resources)